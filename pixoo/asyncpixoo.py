@@ -0,0 +1,333 @@
+import asyncio
+import json
+from tempfile import SpooledTemporaryFile
+from time import perf_counter
+from urllib.parse import urljoin
+
+import aiohttp
+from PIL import Image
+
+from cache import content_hash
+from pixoo import PixooAPI, PixooFrames
+from setup_logger import logger
+from transport import MAX_DOWNLOAD_SIZE
+
+
+class AsyncHTTPTransport:
+    '''
+    Description: the asyncio counterpart of transport.HTTPTransport. The
+        aiohttp session is created on first use, so it always belongs to
+        the running event loop.
+
+    :param connect_timeout: seconds to wait for the connection
+    :param read_timeout: seconds to wait for the response
+    :param pool_maxsize: connections kept alive per host
+    '''
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_maxsize=1):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_maxsize)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                            sock_read=self.read_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def post(self, url, data=None):
+        '''
+        :return: the status code and the decoded json body
+        '''
+        async with self.session.post(url, data=data) as response:
+            return response.status, await response.json(content_type=None)
+
+    async def download(self, url, max_bytes=None, chunk_size=64 * 1024,
+                       spool_size=1024 * 1024, **kwargs):
+        '''
+        Description: the asyncio counterpart of transport.read_body.
+
+        :return: the status code and the body, as a binary file positioned at the start
+        '''
+        async with self.session.get(url, **kwargs) as response:
+            length = response.content_length
+            if max_bytes and length and length > max_bytes:
+                raise ValueError(f"{url} is {length} bytes, the limit is {max_bytes}")
+
+            body = SpooledTemporaryFile(max_size=spool_size)
+            read = 0
+            async for chunk in response.content.iter_chunked(chunk_size):
+                read += len(chunk)
+                if max_bytes and read > max_bytes:
+                    body.close()
+                    raise ValueError(f"{url} is over the limit of {max_bytes} bytes")
+                body.write(chunk)
+            body.seek(0)
+            return response.status, body
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncPixooAPI(PixooAPI):
+    '''
+    Description: every command of PixooAPI, as a coroutine. The command
+        payloads are built by PixooAPI, only the posting is async.
+
+    :param concurrency: the number of posts in flight to the device at once,
+        the firmware doesn't cope with parallel posts so this defaults to 1
+    '''
+    def __init__(self, ip, size=None, refresh=True, transport=None, metrics=None,
+                 remote_cache=None, concurrency=1, state_max_age=30.0):
+        super().__init__(ip, size=size, refresh=refresh,
+                         transport=transport or AsyncHTTPTransport(), metrics=metrics,
+                         remote_cache=remote_cache, state_max_age=state_max_age)
+        self._concurrency = asyncio.Semaphore(concurrency)
+        # held by send_frames() while it takes a PicID and sends the first frame
+        self._pic_id_lock = asyncio.Lock()
+        # the background refreshes of the remote cache
+        self._background = set()
+
+    async def close(self):
+        await self._transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def __post(self, url, data=None):
+        status, response = await self._transport.post(url, data)
+        if status != 200:
+            logger.warning(f"Bad Response Code: {status}")
+        return response
+
+    async def __remote_post(self, url, data=None):
+        sent = perf_counter()
+        response = await self.__post(urljoin(self.remote, url), data)
+        if self._metrics is not None:
+            self._observe_post(url, self._remote_body(data), None, sent, response, 'ReturnCode')
+        return response
+
+    async def _remote_post(self, url=None, data=None, wait=True):
+        cache = self._remote_cache
+        if not cache.caches(url):
+            return self._handle_remote_response(await self.__remote_post(url, data), url)
+
+        response, fresh = cache.lookup(url, data)
+        if not fresh:
+            if response is None and wait:
+                response = await self.__remote_post(url, data)
+                cache.store(url, data, response)
+            elif cache.begin_refresh(url, data):
+                task = asyncio.create_task(self.__refresh(url, data))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        if response is None:
+            return None
+        return self._handle_remote_response(response, url)
+
+    async def __refresh(self, url, data):
+        try:
+            self._remote_cache.store(url, data, await self.__remote_post(url, data))
+        except Exception as e:
+            logger.warning(f"Could not refresh {url}: {e}")
+        finally:
+            self._remote_cache.end_refresh(url, data)
+
+    async def _local_post(self, data=None):
+        result = self._from_state(data)
+        if result is not None:
+            return result
+        start = perf_counter()
+        body = json.dumps(data)
+        async with self._concurrency:
+            sent = perf_counter()
+            response = await self.__post(self.url, body)
+        if self._metrics is not None:
+            self._observe_post(data.get("Command"), body, start, sent, response, 'error_code')
+        result = self._handle_local_response(response, data.get("Command"))
+        self.state.update(data, result)
+        return result
+
+    async def refresh_state(self):
+        self.state.invalidate()
+        await self.get_current_channel()
+        return await self.get_all_setting()
+
+    async def _next_pic_id(self):
+        '''
+        Description: see PixooAPI._next_pic_id(), the caller holds self._pic_id_lock.
+        '''
+        if self._pic_id is None:
+            self._pic_id = (await self.get_sending_animation_pic_id()).pic_id - 1
+        self._pic_id += 1
+        if self._needs_refresh():
+            logger.debug(f"Resetting PicID at {self._pic_id}")
+            await self.reset_sending_animation_pic_id()
+            self._pic_id = 1
+        return self._pic_id
+
+    async def dial_list(self, dial_type=None, page=1):
+        dial_types = (await self.dial_type()).dial_type_list
+        if dial_type not in dial_types:
+            print(f"invalid dial type: {dial_type}; available: {dial_types}")
+            return
+        data = {"DialType": dial_type, "Page": page}
+        return await self._remote_post(url="Channel/GetDialList", data=data)
+
+    async def get_current_channel(self):
+        data = {"Command": "Channel/GetIndex"}
+        return (await self._local_post(data)).select_index
+
+    async def send_text(self, text_id, x, y, dirr, font, text_width, text_string, speed, color, align):
+        font_list = await self.get_font_list(wait=False)
+        if font_list is not None:
+            self._check_font(font, font_list.font_list)
+        data = self.text_command(text_id, x, y, dirr, font, text_width, text_string, speed, color, align)
+        return await self._local_post(data)
+
+    async def get_img_upload_list(self, device_id=None, device_mac=None, page=1):
+        if device_id is None or device_mac is None:
+            device = (await self.find_device()).device_list[0]
+            device_id = device_id or device['DeviceId']
+            device_mac = device_mac or device['DeviceMac']
+        return await super().get_img_upload_list(device_id=device_id, device_mac=device_mac, page=page)
+
+
+class AsyncPixooDevice(PixooFrames, AsyncPixooAPI):
+    def __init__(self, animation_cache=None, max_download_size=MAX_DOWNLOAD_SIZE,
+                 dedupe_frames=False, skip_unchanged=True, resend_after=60.0, **kwargs):
+        super().__init__(**kwargs)
+        self._animation_cache = animation_cache
+        self._max_download_size = max_download_size
+        self._dedupe_frames = dedupe_frames
+        self._skip_unchanged = skip_unchanged
+        self._resend_after = resend_after
+        self.skipped_sends = 0
+
+    async def screen_switch_on(self):
+        await self.screen_switch(on_off=1)
+
+    async def screen_switch_off(self):
+        await self.screen_switch(on_off=0)
+
+    async def sync_orientation(self):
+        settings = await self.get_all_setting()
+        self.set_orientation(rotation=settings.gyrate_angle or 0,
+                             mirror=settings.mirror_flag or 0)
+
+    async def _download(self, url):
+        status, body = await self._transport.download(url, max_bytes=self._max_download_size,
+                                                      headers={'User-Agent': 'null'})
+        if status != 200:
+            logger.warning(f"Bad Response Code: {status}")
+        return body
+
+    async def send_url_gif(self, url):
+        with await self._download(url) as body:
+            await self._send_gif_file(body)
+
+    async def send_local_gif(self, filename):
+        with open(filename, 'rb') as f:
+            await self._send_gif_file(f)
+
+    async def _send_gif_file(self, f):
+        await self.send_frames(await asyncio.to_thread(self._gif_file_frames, f))
+
+    def _gif_file_frames(self, f):
+        '''
+        :return: the encoded frames of a gif file, decoded in a worker thread
+            so the other devices on the event loop aren't stalled
+        '''
+        if self._animation_cache is None:
+            with Image.open(f) as gif:
+                return list(self._gif_frames(gif))
+        return self._cached_gif_frames(content_hash(f), lambda: Image.open(f))
+
+    async def _send_gif(self, gif=None):
+        await self.send_frames(await asyncio.to_thread(lambda: list(self._gif_frames(gif))))
+
+    async def send_frames(self, frames, force=False):
+        key = self._frames_key(frames)
+        if self._unchanged(key, force):
+            logger.debug("Skipped sending an unchanged animation")
+            return
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return
+
+        self._shown = None
+        async with self._pic_id_lock:
+            pic_id = await self._next_pic_id()
+            if (await self.send_animation(pic_id=pic_id, **first)).error_code != 0:
+                # the local PicID drifted, ask the device and try again
+                if self._metrics is not None:
+                    self._metrics.retry("Draw/SendHttpGif")
+                self._pic_id = None
+                pic_id = await self._next_pic_id()
+                await self.send_animation(pic_id=pic_id, **first)
+        for frame in frames:
+            await self.send_animation(pic_id=pic_id, **frame)
+        if key is not None:
+            self._shown = self._sent_key(key)
+
+    async def send_image(self, force=False):
+        if not self.buffer:
+            print(f"The buffer is empty.")
+            return
+        await self._send_image(force)
+
+    async def _send_image(self, force=False):
+        await asyncio.to_thread(self._prepare_buffer)
+        await self.send_frames([self._image_frame()], force)
+
+    async def send_url_image(self, img_url, force=False):
+        await self.url_img_to_buffer(img_url)
+        await self.send_image(force)
+
+    async def url_img_to_buffer(self, img_url):
+        with await self._download(img_url) as body:
+            await asyncio.to_thread(self.local_img_to_buffer, body)
+
+    async def send_local_image(self, filename, force=False):
+        await asyncio.to_thread(self.local_img_to_buffer, filename)
+        await self.send_image(force)
+
+    async def send_canvas(self, canvas, force=False):
+        self.set_buffer_from_canvas(canvas)
+        await self._send_image(force)
+
+
+class AsyncPixoo64(AsyncPixooDevice):
+    def __init__(self, ip, **kwargs):
+        super().__init__(ip=ip, size=64, **kwargs)
+
+
+async def fan_out(devices, command, *args, **kwargs):
+    '''
+    Description: runs the same command on every device at once. Posts to a
+        single device are still limited by its own concurrency.
+
+    :param devices: the async devices
+    :param command: the name of the command, for example "set_brightness"
+    :return: the result, or the raised exception, of each device in order
+    '''
+    calls = (getattr(device, command)(*args, **kwargs) for device in devices)
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    async def main():
+        pixoos = [AsyncPixoo64("192.168.0.154")]
+        await fan_out(pixoos, "send_local_image", "dsotm1.jpg")
+        await fan_out(pixoos, "close")
+
+    asyncio.run(main())
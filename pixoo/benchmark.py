@@ -0,0 +1,414 @@
+'''
+Micro benchmarks for the pixoo hot paths. Run from this directory:
+
+    python benchmark.py encode
+    python benchmark.py orient
+    python benchmark.py transport
+    python benchmark.py ingest
+    python benchmark.py picid
+    python benchmark.py pipeline
+    python benchmark.py canvas
+    python benchmark.py sizing
+    python benchmark.py idle
+    python benchmark.py suite --latency 0.005 --output results.json
+'''
+import argparse
+import base64
+import functools
+import inspect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import requests
+
+from PIL import Image, ImageDraw, ImageOps
+
+from canvas import Canvas, Compositor
+from encoder import array_to_bytes, frame_to_bytes, encode_buffer
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+from qrpixoo import QRCode
+from transport import HTTPTransport
+
+
+def _test_frame(size=64):
+    '''
+    Description: builds a deterministic RGB gradient frame.
+
+    :param size: the width and height of the frame
+    '''
+    frame = Image.new("RGB", (size, size))
+    frame.putdata([((x * 4) % 256, (y * 4) % 256, (x * y) % 256)
+                   for y in range(size) for x in range(size)])
+    return frame
+
+
+def _legacy_encode(frame):
+    '''
+    the original rotate, mirror and per-pixel getpixel walk, kept for comparison
+    '''
+    frame = ImageOps.mirror(frame.rotate(270))
+    buffer = []
+    size_x, size_y = frame.size
+    for x in range(size_x):
+        for y in range(size_y):
+            r, g, b = frame.getpixel((x, y))
+            buffer.append(r)
+            buffer.append(g)
+            buffer.append(b)
+    return str(base64.b64encode(bytearray(buffer)).decode())
+
+
+def _bulk_encode(frame):
+    return encode_buffer(frame_to_bytes(frame))
+
+
+def bench_encode(size=64, number=200):
+    frame = _test_frame(size)
+    assert _legacy_encode(frame) == _bulk_encode(frame), "encoders disagree"
+
+    results = {}
+    for name, func in (("legacy", _legacy_encode), ("bulk", _bulk_encode)):
+        seconds = timeit.timeit(lambda: func(frame), number=number)
+        results[name] = seconds / number * 1e6
+        print(f"{name:>8}: {results[name]:10.1f} us/frame")
+    print(f" speedup: {results['legacy'] / results['bulk']:10.1f}x")
+    return results
+
+
+def bench_orient(size=64, number=1000):
+    frame = _test_frame(size)
+
+    results = {}
+    for rotation in range(4):
+        for mirror in range(2):
+            name = f"{rotation * 90:>3} deg, mirror {mirror}"
+            seconds = timeit.timeit(lambda: frame_to_bytes(frame, rotation, mirror), number=number)
+            results[name] = seconds / number * 1e6
+            print(f"{name}: {results[name]:8.1f} us/frame")
+    return results
+
+
+@contextmanager
+def _fake_pixoo(latency=0.0, **kwargs):
+    '''
+    Description: a FakePixoo64 and a Pixoo64 pointed at it. Unchanged
+        frames are sent too, unless skip_unchanged=True.
+    '''
+    kwargs.setdefault("skip_unchanged", False)
+    with FakePixoo64(latency=latency) as fake:
+        pixoo = Pixoo64(fake.ip, **kwargs)
+        pixoo.url = fake.url
+        try:
+            yield fake, pixoo
+        finally:
+            pixoo.close()
+
+
+def bench_transport(frames=60):
+    payload = json.dumps({"Command": "Draw/SendHttpGif",
+                          "PicID": 1,
+                          "PicWidth": 64,
+                          "PicOffset": 0,
+                          "PicSpeed": 1000,
+                          "PicData": _bulk_encode(_test_frame())})
+
+    results = {}
+    with FakePixoo64() as fake:
+        start = time.perf_counter()
+        for _ in range(frames):
+            requests.post(fake.url, payload)
+        results["requests.post"] = (time.perf_counter() - start) / frames * 1e3
+
+        with HTTPTransport() as transport:
+            start = time.perf_counter()
+            for _ in range(frames):
+                transport.post(fake.url, payload)
+            results["HTTPTransport"] = (time.perf_counter() - start) / frames * 1e3
+
+    for name, ms in results.items():
+        print(f"{name:>14}: {ms:8.3f} ms/frame")
+    return results
+
+
+def noise_gif(filename, frames=240, size=128):
+    '''
+    Description: writes a gif of random noise, which barely compresses,
+        so a few hundred frames make a multi megabyte file.
+    '''
+    rng = random.Random(0)
+    images = [Image.frombytes("P", (size, size), rng.randbytes(size * size))
+              for _ in range(frames)]
+    images[0].save(filename, save_all=True, append_images=images[1:], duration=40)
+    return os.path.getsize(filename)
+
+
+class QuietFileHandler(SimpleHTTPRequestHandler):
+    '''
+    Description: serves files without logging requests, and without a
+        traceback when the client stops reading early.
+    '''
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_ingest(frames=240):
+    directory = tempfile.mkdtemp()
+    size = noise_gif(os.path.join(directory, "noise.gif"), frames=frames)
+    handler = functools.partial(QuietFileHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/noise.gif"
+    print(f"gif: {size / 1e6:.1f} MB, {frames} frames")
+
+    pixoo = Pixoo64("127.0.0.1")
+
+    def whole_body():
+        response = requests.get(url, stream=True)
+        with Image.open(BytesIO(response.content)) as gif:
+            return len(list(pixoo._gif_frames(gif)))
+
+    def streamed():
+        response = pixoo._transport.get(url, stream=True)
+        with pixoo._download(response) as body, Image.open(body) as gif:
+            return len(list(pixoo._gif_frames(gif)))
+
+    results = {}
+    try:
+        for name, func in (("whole body", whole_body), ("streamed", streamed)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            sent = func()
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = {"seconds": seconds, "peak_bytes": peak, "frames": sent}
+            print(f"{name:>10}: {seconds:6.2f} s, peak {peak / 1e6:6.1f} MB, {sent} frames")
+    finally:
+        server.shutdown()
+        server.server_close()
+        pixoo.close()
+    return results
+
+
+def bench_picid(images=50, latency=0.005):
+    print(f"device round trip: {latency * 1e3:.0f} ms")
+
+    results = {}
+    with _fake_pixoo(latency) as (fake, pixoo):
+        pixoo.set_buffer(frame_to_bytes(_test_frame()))
+        for name, forget in (("query every send", True), ("local PicID", False)):
+            pixoo._pic_id = None
+            start = time.perf_counter()
+            for _ in range(images):
+                if forget:
+                    pixoo._pic_id = None
+                pixoo.send_image()
+            results[name] = (time.perf_counter() - start) / images * 1e3
+            print(f"{name:>16}: {results[name]:6.2f} ms/image")
+    return results
+
+
+def bench_pipeline(filename="meme.gif", latency=0.005):
+    results = {}
+    with _fake_pixoo(latency) as (fake, pixoo):
+        for name, depth in (("serial", 0), ("pipelined", 8)):
+            pixoo._pipeline_depth = depth
+            start = time.perf_counter()
+            pixoo.send_local_gif(filename)
+            results[name] = time.perf_counter() - start
+            print(f"{name:>10}: {results[name]:6.3f} s")
+    return results
+
+
+def bench_canvas(number=1000):
+    '''
+    Description: a meter over a static background, drawn and encoded per
+        frame, with PIL and with a Compositor.
+    '''
+    background = _test_frame()
+
+    def pil(level):
+        frame = background.copy()
+        draw = ImageDraw.Draw(frame)
+        draw.text((1, 1), "CPU", fill="white")
+        draw.rectangle((0, 58, level, 63), fill="lime")
+        draw.text((40, 54), f"{level}%", fill="white")
+        return encode_buffer(frame_to_bytes(frame))
+
+    compositor = Compositor()
+    static = compositor.add_layer(static=True)
+    static.blit(background)
+    static.text(1, 1, "CPU", "white")
+    meter = compositor.add_layer()
+
+    def canvas(level):
+        meter.clear()
+        meter.rect(0, 58, level, 6, "lime")
+        meter.text(40, 58, f"{level}%", "white")
+        return encode_buffer(array_to_bytes(compositor.render().pixels))
+
+    results = {}
+    for name, func in (("PIL", pil), ("Compositor", canvas)):
+        seconds = timeit.timeit(lambda: func(random.randrange(64)), number=number)
+        results[name] = seconds / number * 1e6
+        print(f"{name:>10}: {results[name]:8.1f} us/frame")
+    return results
+
+
+def _legacy_square(frame, size=64):
+    '''
+    the original pad to a full size square, then resize, kept for comparison
+    '''
+    x, y = frame.size
+    side = max(x, y)
+    square = Image.new("RGB", (side, side), (0, 0, 0))
+    square.paste(frame, (int((side - x) / 2), int((side - y) / 2)))
+    return square.resize((size, size), Image.Resampling.BILINEAR)
+
+
+def bench_sizing(width=3000, height=2000, number=5):
+    filename = os.path.join(tempfile.mkdtemp(), "cover.jpg")
+    _test_frame().resize((width, height)).save(filename, quality=90)
+    pixoo = Pixoo64("127.0.0.1")
+
+    def sized(mode):
+        def func(img):
+            pixoo.set_sizing(mode)
+            return pixoo.prepare_frame(img)
+        return func
+
+    results = {}
+    cases = [("legacy", _legacy_square)] + [(mode, sized(mode)) for mode in
+                                            ("letterbox", "crop", "entropy", "stretch")]
+    for name, func in cases:
+        start = time.perf_counter()
+        for _ in range(number):
+            with Image.open(filename) as img:
+                func(img)
+        results[name] = (time.perf_counter() - start) / number * 1e3
+        print(f"{name:>10}: {results[name]:7.1f} ms/image")
+    return results
+
+
+def bench_idle(sends=100, changes=5, latency=0.005):
+    '''
+    Description: a monitoring loop that sends a canvas every time, while
+        what it shows only changes a few times.
+    '''
+    results = {}
+    for name, skip in (("send all", False), ("skip unchanged", True)):
+        with _fake_pixoo(latency, skip_unchanged=skip) as (fake, pixoo):
+            canvas = Canvas()
+            start = time.perf_counter()
+            for i in range(sends):
+                if i % (sends // changes) == 0:
+                    canvas.fill((i, 0, 0))
+                pixoo.send_canvas(canvas)
+            seconds = time.perf_counter() - start
+            posts = sum(fake.commands.values())
+        results[name] = {"posts": posts, "skipped": pixoo.skipped_sends,
+                         "ms_per_send": seconds / sends * 1e3}
+        print(f"{name:>14}: {posts:4d} posts, {pixoo.skipped_sends:4d} skipped, "
+              f"{seconds / sends * 1e3:6.2f} ms/send")
+    return results
+
+
+def bench_suite(latency=0.005, rounds=5):
+    '''
+    Description: end to end, against a FakePixoo64: frames per second, bytes
+        per frame and encode time of the main send paths.
+    '''
+    def local_image(pixoo):
+        pixoo.local_img_to_buffer("dsotm1.jpg")
+
+    def qr(pixoo):
+        pixoo.set_buffer(QRCode().add_string("Hello World"))
+
+    def local_gif(pixoo):
+        with Image.open("meme.gif") as gif:
+            return list(pixoo._gif_frames(gif))
+
+    cases = (
+        ("send_local_image", local_image, lambda pixoo: pixoo.send_local_image("dsotm1.jpg")),
+        ("send_local_gif", local_gif, lambda pixoo: pixoo.send_local_gif("meme.gif")),
+        ("qr", qr, lambda pixoo: (qr(pixoo), pixoo.send_image())),
+    )
+
+    results = {"latency": latency}
+    with _fake_pixoo(latency) as (fake, pixoo):
+        for name, encode, send in cases:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                encode(pixoo)
+            encode_seconds = (time.perf_counter() - start) / rounds
+
+            frames = fake.commands["Draw/SendHttpGif"]
+            received = fake.bytes_received
+            start = time.perf_counter()
+            for _ in range(rounds):
+                send(pixoo)
+            seconds = time.perf_counter() - start
+            frames = fake.commands["Draw/SendHttpGif"] - frames
+            received = fake.bytes_received - received
+
+            results[name] = {
+                "fps": frames / seconds,
+                "bytes_per_frame": received / frames,
+                "encode_ms": encode_seconds * 1e3,
+                "send_ms": seconds / rounds * 1e3,
+            }
+            print(f"{name:>16}: {frames / seconds:7.1f} fps, {received / frames:8.0f} bytes/frame, "
+                  f"encode {encode_seconds * 1e3:7.2f} ms, send {seconds / rounds * 1e3:7.2f} ms")
+    return results
+
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "orient": bench_orient,
+    "transport": bench_transport,
+    "ingest": bench_ingest,
+    "picid": bench_picid,
+    "pipeline": bench_pipeline,
+    "canvas": bench_canvas,
+    "sizing": bench_sizing,
+    "idle": bench_idle,
+    "suite": bench_suite,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--latency", type=float,
+                        help="seconds the fake device takes to answer, where it's used")
+    parser.add_argument("--output", help="also save the results to this json file")
+    args = parser.parse_args()
+
+    benchmark = BENCHMARKS[args.benchmark]
+    kwargs = {}
+    if args.latency is not None and "latency" in inspect.signature(benchmark).parameters:
+        kwargs["latency"] = args.latency
+    results = benchmark(**kwargs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": args.benchmark,
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, f, indent=2)
@@ -0,0 +1,442 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from setup_logger import logger
+
+
+def content_hash(content):
+    '''
+    Description: a short, stable hash of some content, for cache keys.
+
+    :param content: bytes, or a binary file which is read to the end and rewound
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        digest.update(content)
+    else:
+        for chunk in iter(lambda: content.read(64 * 1024), b''):
+            digest.update(chunk)
+        content.seek(0)
+    return digest.hexdigest()
+
+
+class AnimationCache:
+    '''
+    Description: caches fully encoded animations, so sending a gif that was
+        sent before only costs the posts. Entries are kept in memory, least
+        recently used first out once max_bytes is reached, and optionally
+        written to a directory so they survive restarts.
+
+    :param max_bytes: the memory budget, counted as the encoded frame data
+    :param directory: optional directory for the on-disk tier
+    '''
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source_id, size, rotation=0, mirror=0):
+        '''
+        :param source_id: identifies the source, a content hash or a url and etag
+        :param size: the device size
+        :param rotation: the device rotation
+        :param mirror: the device mirror mode
+        '''
+        return content_hash(f"{source_id}|{size}|{rotation}|{mirror}".encode())
+
+    @staticmethod
+    def _sizeof(frames):
+        return sum(len(frame['pic_data']) for frame in frames)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (
+            self.directory is not None and os.path.exists(self._path(key)))
+
+    def get(self, key):
+        '''
+        :return: the cached frames, or None
+        '''
+        with self._lock:
+            frames = self._entries.get(key)
+            if frames is not None:
+                self._entries.move_to_end(key)
+                return frames
+
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                frames = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, frames)
+        return frames
+
+    def put(self, key, frames):
+        '''
+        :param frames: the keyword arguments for send_animation(), one per frame
+        '''
+        frames = list(frames)
+        self._remember(key, frames)
+
+        if self.directory is not None:
+            path = self._path(key)
+            temp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp, "w") as f:
+                    json.dump(frames, f)
+                os.replace(temp, path)
+            except OSError as e:
+                logger.warning(f"Could not write animation cache entry: {e}")
+
+    def _remember(self, key, frames):
+        size = self._sizeof(frames)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._sizeof(self._entries.pop(key))
+            self._entries[key] = frames
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self._sizeof(evicted)
+
+    def clear(self):
+        '''
+        Description: empties the memory tier, the disk tier is kept.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class HTTPCache:
+    '''
+    Description: caches downloads by url on disk, for conditional requests:
+        the raw body with its ETag and Last-Modified, and any number of
+        variants made from it, like the encoded frames for a device. Files
+        are evicted least recently used first once max_bytes is reached.
+
+    :param directory: where the entries are kept
+    :param max_bytes: the disk budget
+    '''
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        # key: bytes on disk, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(url):
+        return content_hash(url.encode())
+
+    def _path(self, key, name):
+        return os.path.join(self.directory, f"{key}.{name}")
+
+    def _scan(self):
+        used = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            key = name.split(".", 1)[0]
+            stat = os.stat(os.path.join(self.directory, name))
+            size, last = used.get(key, (0, 0))
+            used[key] = (size + stat.st_size, max(last, stat.st_mtime))
+        for key, (size, _) in sorted(used.items(), key=lambda item: item[1][1]):
+            self._entries[key] = size
+            self.size += size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _meta(self, key):
+        try:
+            with open(self._path(key, "json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def validators(self, url):
+        '''
+        :return: the headers that make the request conditional, empty when
+            the url isn't cached
+        '''
+        key = self.key(url)
+        meta = self._meta(key)
+        if meta is None or not os.path.exists(self._path(key, "body")):
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def body(self, url):
+        '''
+        :return: the cached body as an open binary file, or None
+        '''
+        key = self.key(url)
+        try:
+            body = open(self._path(key, "body"), "rb")
+        except OSError:
+            return None
+        self._touch(key)
+        return body
+
+    def put(self, url, headers, body):
+        '''
+        Description: keeps a body, when it has a validator to ask for it
+            again with. The variants of an older body are dropped.
+
+        :param url: the url
+        :param headers: the response headers
+        :param body: a binary file, rewound afterwards
+        '''
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        key = self.key(url)
+        self._remove(key)
+        self._write(key, "body", body)
+        body.seek(0)
+        self._write(key, "json", json.dumps({"url": url, "etag": etag,
+                                             "last_modified": last_modified}).encode())
+
+    def variant(self, url, name):
+        '''
+        :param name: the variant, for example the device size and orientation
+        :return: the variant as bytes, or None
+        '''
+        key = self.key(url)
+        try:
+            with open(self._path(key, f"{name}.variant"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(key)
+        return data
+
+    def put_variant(self, url, name, data):
+        '''
+        :param data: bytes made from the cached body
+        '''
+        key = self.key(url)
+        if key in self._entries:
+            self._write(key, f"{name}.variant", data)
+
+    def _write(self, key, name, data):
+        path = self._path(key, name)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(temp, "wb") as f:
+                if isinstance(data, bytes):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+                size = f.tell()
+            os.replace(temp, path)
+        except OSError as e:
+            logger.warning(f"Could not write http cache entry: {e}")
+            return
+        with self._lock:
+            self._entries[key] = self._entries.pop(key, 0) + size - replaced
+            self.size += size - replaced
+        self._evict()
+
+    def _touch(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key, "json"))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self.size <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key = next(iter(self._entries))
+            self._remove(key)
+
+    def _remove(self, key):
+        with self._lock:
+            self.size -= self._entries.pop(key, 0)
+        prefix = f"{key}."
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+# seconds the answers of the divoom cloud stay fresh, endpoints not listed
+# are always asked
+REMOTE_TTLS = {
+    "Device/GetTimeDialFontList": 7 * 24 * 3600,
+    "Channel/GetDialType": 24 * 3600,
+    "Channel/GetDialList": 24 * 3600,
+    "Device/ReturnSameLANDevice": 3600,
+}
+
+
+class RemoteCache:
+    '''
+    Description: caches the answers of the divoom cloud, for every device
+        using it. An answer is fresh for the ttl of its endpoint, after that
+        it's still returned while it's fetched again in the background
+        (stale while revalidate), so a slow or offline cloud doesn't hold
+        up the panel once an answer is known.
+
+    :param ttls: seconds an answer stays fresh, per endpoint
+    :param path: optional json file the answers are loaded from and saved to,
+        so they survive restarts
+    '''
+    def __init__(self, ttls=REMOTE_TTLS, path=None):
+        self.ttls = dict(ttls)
+        self.path = path
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        if path:
+            self._load()
+
+    @staticmethod
+    def key(url, data=None):
+        return f"{url} {json.dumps(data, sort_keys=True)}"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def caches(self, url):
+        '''
+        :return: True when the answers of the endpoint are cached
+        '''
+        return bool(self.ttls.get(url))
+
+    def lookup(self, url, data=None):
+        '''
+        :return: the cached answer or None, and True when it's fresh
+        '''
+        entry = self._entries.get(self.key(url, data))
+        if entry is None:
+            return None, False
+        stored, response = entry
+        return response, time.time() - stored < self.ttls.get(url, 0)
+
+    def store(self, url, data, response):
+        '''
+        Description: keeps an answer, unless the cloud returned an error.
+        '''
+        if response.get("ReturnCode", 0) != 0:
+            return
+        with self._lock:
+            self._entries[self.key(url, data)] = (time.time(), response)
+        if self.path:
+            self._save()
+
+    def begin_refresh(self, url, data=None):
+        '''
+        :return: True when the answer isn't being fetched already, the caller
+            then fetches it and calls self.end_refresh()
+        '''
+        key = self.key(url, data)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, url, data=None):
+        with self._lock:
+            self._refreshing.discard(self.key(url, data))
+
+    def get(self, url, data, fetch, wait=True):
+        '''
+        :param url: the endpoint
+        :param data: the request
+        :param fetch: asks the cloud, returns the decoded answer
+        :param wait: on a miss, False fetches in the background and returns None
+        :return: the answer
+        '''
+        response, fresh = self.lookup(url, data)
+        if fresh:
+            return response
+        if response is None and wait:
+            response = fetch()
+            self.store(url, data, response)
+            return response
+
+        if self.begin_refresh(url, data):
+            threading.Thread(target=self._refresh, args=(url, data, fetch),
+                             name="pixoo-remote-cache", daemon=True).start()
+        return response
+
+    def _refresh(self, url, data, fetch):
+        try:
+            self.store(url, data, fetch())
+        except Exception as e:
+            logger.warning(f"Could not refresh {url}: {e}")
+        finally:
+            self.end_refresh(url, data)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._entries = {key: tuple(entry) for key, entry in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read remote cache {self.path}: {e}")
+
+    def _save(self):
+        with self._lock:
+            entries = dict(self._entries)
+        temp = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(entries, f)
+            os.replace(temp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write remote cache {self.path}: {e}")
+
+    def clear(self):
+        '''
+        Description: forgets every answer, the file is kept.
+        '''
+        with self._lock:
+            self._entries.clear()
+
+
+# the cache devices share, unless they are given their own
+REMOTE_CACHE = RemoteCache()
@@ -0,0 +1,343 @@
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageColor
+
+# a 3x5 bitmap font, five rows of three pixels each, "#" is lit
+_FONT = {
+    " ": "... ... ... ... ...",
+    "0": "### #.# #.# #.# ###",
+    "1": ".#. ##. .#. .#. ###",
+    "2": "### ..# ### #.. ###",
+    "3": "### ..# .## ..# ###",
+    "4": "#.# #.# ### ..# ..#",
+    "5": "### #.. ### ..# ###",
+    "6": "### #.. ### #.# ###",
+    "7": "### ..# ..# .#. .#.",
+    "8": "### #.# ### #.# ###",
+    "9": "### #.# ### ..# ###",
+    "A": ".#. #.# ### #.# #.#",
+    "B": "##. #.# ##. #.# ##.",
+    "C": ".## #.. #.. #.. .##",
+    "D": "##. #.# #.# #.# ##.",
+    "E": "### #.. ##. #.. ###",
+    "F": "### #.. ##. #.. #..",
+    "G": ".## #.. #.# #.# .##",
+    "H": "#.# #.# ### #.# #.#",
+    "I": "### .#. .#. .#. ###",
+    "J": "..# ..# ..# #.# .#.",
+    "K": "#.# #.# ##. #.# #.#",
+    "L": "#.. #.. #.. #.. ###",
+    "M": "#.# ### ### #.# #.#",
+    "N": "##. #.# #.# #.# #.#",
+    "O": ".#. #.# #.# #.# .#.",
+    "P": "##. #.# ##. #.. #..",
+    "Q": ".#. #.# #.# ##. .##",
+    "R": "##. #.# ##. #.# #.#",
+    "S": ".## #.. .#. ..# ##.",
+    "T": "### .#. .#. .#. .#.",
+    "U": "#.# #.# #.# #.# ###",
+    "V": "#.# #.# #.# #.# .#.",
+    "W": "#.# #.# ### ### #.#",
+    "X": "#.# #.# .#. #.# #.#",
+    "Y": "#.# #.# .#. .#. .#.",
+    "Z": "### ..# .#. #.. ###",
+    ".": "... ... ... ... .#.",
+    ",": "... ... ... .#. #..",
+    ":": "... .#. ... .#. ...",
+    "-": "... ... ### ... ...",
+    "+": "... .#. ### .#. ...",
+    "=": "... ### ... ### ...",
+    "_": "... ... ... ... ###",
+    "/": "..# ..# .#. #.. #..",
+    "%": "#.# ..# .#. #.. #.#",
+    "!": ".#. .#. .#. ... .#.",
+    "?": "### ..# .## ... .#.",
+    "'": ".#. .#. ... ... ...",
+    "(": "..# .#. .#. .#. ..#",
+    ")": "#.. .#. .#. .#. #..",
+    "°": ".#. #.# .#. ... ...",
+}
+_GLYPHS = {char: np.array([[pixel == "#" for pixel in row] for row in rows.split()])
+           for char, rows in _FONT.items()}
+
+FONT_HEIGHT = 5
+FONT_WIDTH = 3
+
+
+@lru_cache(maxsize=256)
+def text_mask(string, scale=1):
+    '''
+    :param string: the text, lower case is drawn as upper case and unknown
+        characters as "?"
+    :param scale: the whole number the glyphs are scaled by
+    :return: a read only bool array of the lit pixels, one pixel between characters
+    '''
+    glyphs = [_GLYPHS.get(char, _GLYPHS["?"]) for char in string.upper()]
+    if not glyphs:
+        mask = np.zeros((FONT_HEIGHT, 0), dtype=bool)
+    else:
+        spacer = np.zeros((FONT_HEIGHT, 1), dtype=bool)
+        mask = np.hstack([part for glyph in glyphs for part in (glyph, spacer)][:-1])
+    if scale > 1:
+        mask = mask.repeat(scale, axis=0).repeat(scale, axis=1)
+    mask.setflags(write=False)
+    return mask
+
+
+def _rgb(color):
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color)[:3]
+
+
+class Canvas:
+    '''
+    Description: a frame to draw on, backed by a contiguous uint8 array of
+        shape (size, size, 3), rows top to bottom. Every primitive is a few
+        array operations, and anything drawn out of bounds is clipped.
+        Send it with PixooDevice.send_canvas(), the pixels aren't copied.
+
+        A transparent canvas also has an alpha channel, nothing is opaque
+        until drawn on, for layers in a Compositor.
+
+    :param size: the width and height
+    :param background: the color it starts with
+    :param transparent: keep an alpha channel
+
+    example:
+        canvas = Canvas()
+        canvas.rect(0, 40, 64, 24, "#202020")
+        canvas.line(0, 63, 63, 40, "red")
+        canvas.text(2, 2, "21.5°", "white", scale=2)
+        pixoo.send_canvas(canvas)
+    '''
+    def __init__(self, size=64, background=(0, 0, 0), transparent=False):
+        self.size = size
+        self.background = _rgb(background)
+        self.pixels = np.empty((size, size, 3), dtype=np.uint8)
+        self.alpha = np.zeros((size, size), dtype=np.uint8) if transparent else None
+        # True once the alpha holds values other than 0 and 255
+        self._soft = False
+        self.clear()
+
+    @classmethod
+    def from_image(cls, img, transparent=False):
+        '''
+        :param img: a square PIL image, see PixooFrames.prepare_frame() to fit one first
+        '''
+        canvas = cls(img.size[0], transparent=transparent)
+        canvas.blit(img, 0, 0)
+        return canvas
+
+    def to_image(self):
+        return Image.fromarray(self.pixels, "RGB")
+
+    def clear(self):
+        '''
+        Description: back to the background color, and fully transparent.
+        '''
+        self.pixels[...] = self.background
+        if self.alpha is not None:
+            self.alpha[...] = 0
+            self._soft = False
+
+    def _clip(self, x, y, width, height):
+        '''
+        :return: the slices of the canvas and of the source inside the bounds, or None
+        '''
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.size), min(y + height, self.size)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return ((slice(y0, y1), slice(x0, x1)),
+                (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)))
+
+    def fill(self, color):
+        self.pixels[...] = _rgb(color)
+        if self.alpha is not None:
+            self.alpha[...] = 255
+            self._soft = False
+
+    def rect(self, x, y, width, height, color, fill=True):
+        '''
+        :param fill: False only draws the outline
+        '''
+        if not fill:
+            self.rect(x, y, width, 1, color)
+            self.rect(x, y + height - 1, width, 1, color)
+            self.rect(x, y, 1, height, color)
+            self.rect(x + width - 1, y, 1, height, color)
+            return
+        clipped = self._clip(x, y, width, height)
+        if clipped is None:
+            return
+        region, _ = clipped
+        self.pixels[region] = _rgb(color)
+        if self.alpha is not None:
+            self.alpha[region] = 255
+
+    def line(self, x0, y0, x1, y1, color):
+        steps = max(abs(x1 - x0), abs(y1 - y0)) + 1
+        xs = np.rint(np.linspace(x0, x1, steps)).astype(np.intp)
+        ys = np.rint(np.linspace(y0, y1, steps)).astype(np.intp)
+        self.points(xs, ys, color)
+
+    def points(self, xs, ys, color):
+        '''
+        Description: sets single pixels, for example the samples of a graph.
+
+        :param xs: the x of every pixel, an array or a list
+        :param ys: the y of every pixel
+        '''
+        xs, ys = np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp)
+        inside = (xs >= 0) & (xs < self.size) & (ys >= 0) & (ys < self.size)
+        xs, ys = xs[inside], ys[inside]
+        self.pixels[ys, xs] = _rgb(color)
+        if self.alpha is not None:
+            self.alpha[ys, xs] = 255
+
+    def mask(self, x, y, mask, color):
+        '''
+        Description: colors the pixels where a bool array is True.
+
+        :param mask: a 2d bool array, its top left goes to (x, y)
+        '''
+        clipped = self._clip(x, y, mask.shape[1], mask.shape[0])
+        if clipped is None:
+            return
+        region, source = clipped
+        mask = mask[source]
+        self.pixels[region][mask] = _rgb(color)
+        if self.alpha is not None:
+            self.alpha[region][mask] = 255
+
+    def text(self, x, y, string, color, scale=1):
+        '''
+        Description: draws text in the built in 3x5 bitmap font.
+
+        :param scale: the whole number the glyphs are scaled by
+        :return: the width of the text in pixels
+        '''
+        mask = text_mask(string, scale)
+        self.mask(x, y, mask, color)
+        return mask.shape[1]
+
+    def blit(self, source, x=0, y=0, opacity=1.0):
+        '''
+        Description: draws an image over the canvas, blending by its alpha.
+
+        :param source: a Canvas, a PIL image, or a uint8 array of shape
+            (height, width, 3) or (height, width, 4)
+        :param opacity: multiplies the alpha, 0 to 1
+        '''
+        alpha = None
+        if isinstance(source, Canvas):
+            pixels, alpha = source.pixels, source.alpha
+        else:
+            if isinstance(source, Image.Image):
+                source = np.asarray(source.convert("RGBA" if "A" in source.getbands() else "RGB"))
+            pixels = source[..., :3]
+            if source.shape[2] == 4:
+                alpha = source[..., 3]
+
+        clipped = self._clip(x, y, pixels.shape[1], pixels.shape[0])
+        if clipped is None:
+            return
+        region, part = clipped
+        pixels = pixels[part]
+        alpha = None if alpha is None else alpha[part]
+        if opacity < 1.0:
+            alpha = np.full(pixels.shape[:2], 255, dtype=np.uint8) if alpha is None else alpha
+            alpha = (alpha * opacity).astype(np.uint8)
+
+        if alpha is None:
+            self.pixels[region] = pixels
+            if self.alpha is not None:
+                self.alpha[region] = 255
+            return
+
+        if opacity < 1.0:
+            hard = False
+        elif isinstance(source, Canvas):
+            hard = not source._soft
+        else:
+            hard = not np.any((alpha > 0) & (alpha < 255))
+        if hard:
+            opaque = alpha == 255
+            np.copyto(self.pixels[region], pixels, where=opaque[..., None])
+        else:
+            a = alpha[..., None].astype(np.uint16)
+            target = self.pixels[region]
+            target[...] = (pixels * a + target * (255 - a) + 127) // 255
+        if self.alpha is not None:
+            target = self.alpha[region]
+            if hard:
+                target[alpha == 255] = 255
+            else:
+                target[...] = np.maximum(target, alpha)
+                self._soft = True
+
+
+class Compositor:
+    '''
+    Description: mixes layers into a frame. Static layers, like a
+        background picture or the labels of a dashboard, are flattened once
+        and kept; each render() only copies that and draws the changing
+        layers over it. Static layers are always below the changing ones.
+
+    :param size: the width and height
+
+    example:
+        compositor = Compositor()
+        compositor.add_layer(static=True).blit(background)
+        meter = compositor.add_layer()
+        while True:
+            meter.clear()
+            meter.rect(0, 60, level, 4, "lime")
+            pixoo.send_canvas(compositor.render())
+    '''
+    def __init__(self, size=64):
+        self.size = size
+        self.layers = []
+        self.frame = Canvas(size)
+        self._background = None
+
+    def add_layer(self, static=False):
+        '''
+        :param static: True when it rarely changes, call self.invalidate() after drawing on it
+        :return: the transparent Canvas of the layer, on top of the layers before
+        '''
+        canvas = Canvas(self.size, transparent=True)
+        self.layers.append((canvas, static))
+        self._background = None
+        return canvas
+
+    def remove_layer(self, canvas):
+        self.layers = [(layer, static) for layer, static in self.layers if layer is not canvas]
+        self._background = None
+
+    def invalidate(self):
+        '''
+        Description: flattens the static layers again on the next render().
+        '''
+        self._background = None
+
+    def _flatten(self):
+        background = Canvas(self.size)
+        for canvas, static in self.layers:
+            if static:
+                background.blit(canvas)
+        self._background = background.pixels
+
+    def render(self):
+        '''
+        :return: the frame, the same Canvas every time
+        '''
+        if self._background is None:
+            self._flatten()
+        np.copyto(self.frame.pixels, self._background)
+        for canvas, static in self.layers:
+            if not static:
+                self.frame.blit(canvas)
+        return self.frame
@@ -0,0 +1,145 @@
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+DITHERS = (None, "ordered", "floyd-steinberg")
+
+
+@lru_cache(maxsize=32)
+def color_lut(gamma=1.0, white_balance=(100, 100, 100), brightness=100):
+    '''
+    Description: the lookup table for a correction, built once per combination.
+
+    :param gamma: the exponent applied to every channel, above 1 darkens the
+        mid tones, which the LEDs show too bright
+    :param white_balance: the red, green and blue gains, 0 to 100 like
+        PixooAPI.set_white_balance()
+    :param brightness: the overall gain, 0 to 100 like PixooAPI.set_brightness()
+    :return: 768 values, 256 per channel, for Image.point()
+    '''
+    levels = (np.arange(256) / 255.0) ** gamma
+    lut = []
+    for gain in white_balance:
+        channel = np.rint(255.0 * levels * (gain / 100.0) * (brightness / 100.0))
+        lut.extend(np.clip(channel, 0, 255).astype(np.uint8).tolist())
+    return tuple(lut)
+
+
+@lru_cache(maxsize=8)
+def _bayer(size):
+    '''
+    :return: the ordered dither thresholds, an 8x8 bayer matrix tiled to the
+        size, from -0.5 to 0.5
+    '''
+    matrix = np.zeros((1, 1))
+    while len(matrix) < 8:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                           [4 * matrix + 3, 4 * matrix + 1]])
+    matrix = (matrix + 0.5) / matrix.size - 0.5
+    tiles = -(-size // 8)
+    thresholds = np.tile(matrix, (tiles, tiles))[:size, :size, None].astype(np.float32)
+    thresholds.setflags(write=False)
+    return thresholds
+
+
+def ordered_dither(frame, levels=32):
+    '''
+    Description: reduces every channel to a number of levels, with an 8x8
+        bayer pattern instead of banding.
+
+    :param frame: a square RGB PIL image
+    :param levels: the levels kept per channel
+    '''
+    step = 255.0 / (levels - 1)
+    pixels = np.asarray(frame, dtype=np.float32)
+    pixels = np.rint(pixels / step + _bayer(frame.size[0]))
+    pixels = np.clip(pixels * step, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def palette_dither(frame, colors=64):
+    '''
+    Description: reduces the frame to an adaptive palette, with
+        Floyd-Steinberg error diffusion. Pillow only dithers when it's given
+        a palette, so the palette is built first.
+
+    :param frame: an RGB PIL image
+    :param colors: the size of the palette, at most 256
+    '''
+    palette = frame.quantize(colors, method=Image.Quantize.FASTOCTREE)
+    return frame.quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG).convert("RGB")
+
+
+class ColorStage:
+    '''
+    Description: color processing for prepared frames: a gamma, white
+        balance and brightness correction through a cached lookup table,
+        then optional dithering. The correction is done in software, on top
+        of what the device does with its own settings. The white balance and
+        brightness left as None follow the ones the device was set to, as far
+        as its state.DeviceState knows them, and 100 while it doesn't.
+
+    :param gamma: see color_lut()
+    :param white_balance: see color_lut(), None follows the device
+    :param brightness: see color_lut(), None follows the device
+    :param dither: None, "ordered" or "floyd-steinberg"
+    :param levels: the levels per channel kept by ordered dithering
+    :param colors: the palette size of floyd-steinberg dithering
+    '''
+    def __init__(self, gamma=1.0, white_balance=None, brightness=None, dither=None,
+                 levels=32, colors=64):
+        if dither not in DITHERS:
+            raise ValueError(f"unknown dither {dither}, use one of {DITHERS}")
+        self.gamma = gamma
+        self.white_balance = None if white_balance is None else tuple(white_balance)
+        self.brightness = brightness
+        self.dither = dither
+        self.levels = levels
+        self.colors = colors
+
+    @property
+    def identity(self):
+        '''
+        :return: whether the stage never changes a frame
+        '''
+        return (self.gamma == 1.0 and self.white_balance == (100, 100, 100)
+                and self.brightness == 100 and self.dither is None)
+
+    def settings(self, state=None):
+        '''
+        :param state: the state.DeviceState of the device, None when there's none
+        :return: the gamma, white balance and brightness used for a frame
+        '''
+        white_balance = self.white_balance
+        if white_balance is None:
+            white_balance = tuple(100 if state is None else state.get(field, 100)
+                                  for field in ("r_value", "g_value", "b_value"))
+        brightness = self.brightness
+        if brightness is None:
+            brightness = 100 if state is None else state.get("brightness", 100)
+        return self.gamma, white_balance, brightness
+
+    def key(self, state=None):
+        '''
+        :param state: see self.settings()
+        :return: identifies the settings, for cache keys
+        '''
+        gamma, white_balance, brightness = self.settings(state)
+        return (f"g{gamma}-wb{','.join(map(str, white_balance))}-b{brightness}"
+                f"-{self.dither}-{self.levels if self.dither == 'ordered' else self.colors}")
+
+    def __call__(self, frame, state=None):
+        '''
+        :param frame: a prepared RGB frame
+        :param state: see self.settings()
+        :return: the processed frame
+        '''
+        settings = self.settings(state)
+        if settings != (1.0, (100, 100, 100), 100):
+            frame = frame.point(color_lut(*settings))
+        if self.dither == "ordered":
+            frame = ordered_dither(frame, self.levels)
+        elif self.dither == "floyd-steinberg":
+            frame = palette_dither(frame, self.colors)
+        return frame
@@ -0,0 +1,124 @@
+import json
+
+from setup_logger import logger
+
+
+class Dashboard:
+    '''
+    Description: a live dashboard on a device. It keeps a model of what is
+        on the panel, and each flush() only sends what changed: texts and
+        display items in a single "Draw/CommandList" post, and a full frame
+        only when the background pixels changed.
+
+    :param device: the PixooDevice to draw on
+
+    example:
+        dashboard = Dashboard(pixoo)
+        dashboard.set_background(img)
+        dashboard.set_text(0, "12:00", y=24, align=2)
+        dashboard.flush()
+    '''
+    def __init__(self, device):
+        self.device = device
+
+        # what should be on the panel
+        self._background = None
+        self._texts = {}
+        self._items = {}
+
+        # what is on the panel
+        self._shown_background = None
+        self._shown_texts = {}
+        self._shown_items = {}
+
+        self.bytes_sent = 0
+        self.full_frames = 0
+        self.partial_updates = 0
+
+    def set_background(self, img):
+        '''
+        :param img: a PIL image, it's prepared and encoded now
+        '''
+        frame = self.device.prepare_frame(img)
+        self._background = self.device.frame_to_buffer(frame)
+
+    def set_text(self, text_id, text_string, x=0, y=0, dirr=0, font=0, text_width=64,
+                 speed=0, color="#FFFFFF", align=1):
+        '''
+        Description: shows a text, see PixooAPI.send_text() for the parameters.
+        '''
+        self._texts[text_id] = self.device.text_command(text_id, x, y, dirr, font, text_width,
+                                                        text_string, speed, color, align)
+
+    def remove_text(self, text_id):
+        self._texts.pop(text_id, None)
+
+    def set_item(self, text_id, type, **kwargs):
+        '''
+        Description: shows a display item, see PixooAPI.display_item() for the parameters.
+        '''
+        self._items[text_id] = self.device.display_item(text_id, type, **kwargs)
+
+    def remove_item(self, text_id):
+        self._items.pop(text_id, None)
+
+    def invalidate(self):
+        '''
+        Description: forgets what is on the panel, so the next flush() sends
+            everything. Call it when something else drew on the panel.
+        '''
+        self._shown_background = None
+        self._shown_texts = {}
+        self._shown_items = {}
+        self.device.invalidate_frame()
+
+    def _changes(self):
+        '''
+        :return: the text and display list commands that bring the panel up to date
+        '''
+        commands = []
+        removed = (self._shown_texts.keys() - self._texts.keys()
+                   or self._shown_items.keys() - self._items.keys())
+        if removed:
+            # there is no way to clear a single text area
+            commands.append({"Command": "Draw/ClearHttpText"})
+            self._shown_texts = {}
+            self._shown_items = {}
+
+        commands.extend(command for text_id, command in self._texts.items()
+                        if self._shown_texts.get(text_id) != command)
+        items = [item for text_id, item in self._items.items()
+                 if self._shown_items.get(text_id) != item]
+        if items:
+            commands.append({"Command": "Draw/SendHttpItemList", "ItemList": items})
+        return commands
+
+    def flush(self):
+        '''
+        Description: sends what changed since the last flush.
+
+        :return: the number of bytes posted
+        '''
+        sent = 0
+        if self._background is not None and self._background != self._shown_background:
+            self.device.set_buffer(self._background)
+            # the dashboard knows the panel changed, don't let the device skip it
+            self.device.send_image(force=True)
+            sent += len(self.device.buffer_str)
+            self.full_frames += 1
+            self._shown_background = self._background
+            # texts and items belong to the animation they were drawn on
+            self._shown_texts = {}
+            self._shown_items = {}
+
+        commands = self._changes()
+        if commands:
+            sent += len(json.dumps({"Command": "Draw/CommandList", "CommandList": commands}))
+            self.device.command_list(commands)
+            self.partial_updates += 1
+            self._shown_texts = dict(self._texts)
+            self._shown_items = dict(self._items)
+
+        logger.debug(f"Dashboard flush: {sent} bytes")
+        self.bytes_sent += sent
+        return sent
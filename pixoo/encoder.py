@@ -0,0 +1,82 @@
+import base64
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=32)
+def orientation_index(width, height, rotation=0, mirror=0):
+    '''
+    Description: builds the pixel permutation for an orientation, once per
+        (size, rotation, mirror) combination. Indexing the flattened, row-major
+        pixels of a frame with it yields the oriented pixels.
+
+    :param width: frame width
+    :param height: frame height
+    :param rotation: 0: normal; 1: 90; 2: 180; 3: 270, clockwise
+    :param mirror: 0: disable; 1: enable, flips left to right after rotating
+    :return: a read only array of flat pixel indices, or None for the identity
+    '''
+    rotation %= 4
+    if not rotation and not mirror:
+        return None
+    if rotation % 2 and width != height:
+        raise ValueError(f"can only rotate square frames, got {width}x{height}")
+    index = np.arange(width * height, dtype=np.intp).reshape(height, width)
+    index = np.rot90(index, -rotation)
+    if mirror:
+        index = np.fliplr(index)
+    index = np.ascontiguousarray(index).ravel()
+    index.setflags(write=False)
+    return index
+
+
+def frame_to_bytes(frame, rotation=0, mirror=0):
+    '''
+    Description: converts a frame into the raw RGB bytes the device expects,
+        left to right and top to bottom, applying the orientation with a
+        single gather.
+
+    :param frame: a single image frame,
+        this can be either an image or a frame from a gif
+    :param rotation: 0: normal; 1: 90; 2: 180; 3: 270, clockwise
+    :param mirror: 0: disable; 1: enable
+    :return: bytes, 3 per pixel
+    '''
+    if frame.mode != 'RGB':
+        frame = frame.convert("RGB")
+    index = orientation_index(*frame.size, rotation, mirror)
+    if index is None:
+        return frame.tobytes()
+    pixels = np.asarray(frame).reshape(-1, 3)
+    return pixels.take(index, axis=0).tobytes()
+
+
+def array_to_bytes(pixels, rotation=0, mirror=0):
+    '''
+    Description: the array counterpart of frame_to_bytes(). Without an
+        orientation the pixels aren't copied, the result is a view of the
+        array, so it changes when the array does.
+
+    :param pixels: a C contiguous uint8 array of shape (height, width, 3)
+    :param rotation: 0: normal; 1: 90; 2: 180; 3: 270, clockwise
+    :param mirror: 0: disable; 1: enable
+    :return: a bytes-like object, 3 bytes per pixel
+    '''
+    height, width = pixels.shape[:2]
+    index = orientation_index(width, height, rotation, mirror)
+    if index is None:
+        return pixels.reshape(-1).data
+    return pixels.reshape(-1, 3).take(index, axis=0).tobytes()
+
+
+def encode_buffer(buffer):
+    '''
+    Description: base64 encodes a buffer for the "PicData" field.
+
+    :param buffer: a bytes-like object (or a list of ints) of RGB data
+    :return: the base64 string
+    '''
+    if not isinstance(buffer, (bytes, bytearray, memoryview)):
+        buffer = bytes(buffer)
+    return base64.b64encode(buffer).decode()
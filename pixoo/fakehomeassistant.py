@@ -0,0 +1,178 @@
+'''
+A simulated Home Assistant with one media player, for trying out
+haspotify.AlbumArtSync without a server:
+
+    async with FakeHomeAssistant() as hass:
+        haspotify = HASpotify(token=hass.token, interface=hass.url,
+                              entity_id=hass.entity_id)
+        sync = AlbumArtSync(pixoo, haspotify)
+        task = asyncio.create_task(sync.run())
+        await hass.play("track 1")
+'''
+import asyncio
+import hashlib
+from collections import Counter
+from io import BytesIO
+
+from aiohttp import web
+from PIL import Image
+
+
+class FakeHomeAssistant:
+    '''
+    Description: serves the parts of the Home Assistant api the album cover
+        sync uses: the websocket api with auth and state triggers, the state
+        of the player, and the covers, a plain color per track.
+
+    :param entity_id: the media player
+    :param token: the access token it accepts
+    :param host: the address to listen on
+    :param port: the port to listen on, 0 picks a free one
+    :param cover_size: the width and height of the covers
+    :param cover_latency: seconds before a cover is served
+    '''
+    def __init__(self, entity_id="media_player.spotify", token="token", host="127.0.0.1",
+                 port=0, cover_size=300, cover_latency=0.0):
+        self.entity_id = entity_id
+        self.token = token
+        self.host = host
+        self.port = port
+        self.cover_size = cover_size
+        self.cover_latency = cover_latency
+        # the next connections closed during the handshake, like while it restarts
+        self.drop_handshakes = 0
+
+        self.state = {"entity_id": entity_id, "state": "idle", "attributes": {}}
+        self.requests = Counter()
+        self._sockets = set()
+        self._runner = None
+
+        app = web.Application()
+        app.router.add_get("/api/websocket", self._websocket)
+        app.router.add_get("/api/states/{entity_id}", self._get_state)
+        app.router.add_get("/api/media_player_proxy/{entity_id}", self._cover)
+        self._app = app
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    @property
+    def subscribers(self):
+        return len(self._sockets)
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.disconnect()
+        await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def play(self, track):
+        '''
+        Description: changes the track, the subscribers get the new state.
+        '''
+        await self.set_state({"entity_id": self.entity_id,
+                              "state": "playing",
+                              "attributes": {
+                                  "media_title": track,
+                                  "entity_picture": f"/api/media_player_proxy/{self.entity_id}"
+                                                    f"?token=abc&cache={hashlib.md5(track.encode()).hexdigest()}",
+                              }})
+
+    async def set_state(self, state):
+        old_state, self.state = self.state, state
+        for ws, subscription in list(self._sockets):
+            await ws.send_json({"id": subscription,
+                                "type": "event",
+                                "event": {"variables": {"trigger": {
+                                    "platform": "state",
+                                    "entity_id": self.entity_id,
+                                    "from_state": old_state,
+                                    "to_state": state}}}})
+
+    async def disconnect(self):
+        '''
+        Description: closes every websocket, like a restart of Home Assistant.
+        '''
+        for ws, _ in list(self._sockets):
+            await ws.close()
+
+    def _authorized(self, request):
+        return request.headers.get("Authorization") == f"Bearer {self.token}"
+
+    async def _get_state(self, request):
+        self.requests["state"] += 1
+        if not self._authorized(request):
+            raise web.HTTPUnauthorized()
+        return web.json_response(self.state)
+
+    async def _cover(self, request):
+        self.requests["cover"] += 1
+        await asyncio.sleep(self.cover_latency)
+        color = hashlib.md5(request.query.get("cache", "").encode()).digest()[:3]
+        cover = BytesIO()
+        Image.new("RGB", (self.cover_size, self.cover_size), tuple(color)).save(cover, "JPEG")
+        return web.Response(body=cover.getvalue(), content_type="image/jpeg")
+
+    async def _websocket(self, request):
+        self.requests["websocket"] += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"type": "auth_required", "ha_version": "2024.1.0"})
+        if self.drop_handshakes:
+            self.drop_handshakes -= 1
+            await ws.close()
+            return ws
+        auth = await ws.receive_json()
+        if auth.get("access_token") != self.token:
+            await ws.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+            await ws.close()
+            return ws
+        await ws.send_json({"type": "auth_ok", "ha_version": "2024.1.0"})
+
+        subscription = None
+        try:
+            async for message in ws:
+                data = message.json()
+                if data.get("type") == "subscribe_trigger":
+                    if subscription is not None:
+                        self._sockets.discard((ws, subscription))
+                    subscription = data["id"]
+                    self._sockets.add((ws, subscription))
+                    await ws.send_json({"id": subscription, "type": "result",
+                                        "success": True, "result": None})
+                else:
+                    await ws.send_json({"id": data.get("id"), "type": "result", "success": False,
+                                        "error": {"code": "unknown_command",
+                                                  "message": "Unknown command."}})
+        finally:
+            self._sockets.discard((ws, subscription))
+        return ws
+
+
+if __name__ == "__main__":
+    async def main():
+        async with FakeHomeAssistant(port=8123) as hass:
+            print(f"serving on {hass.url}, token {hass.token}")
+            track = 0
+            while True:
+                await asyncio.sleep(10)
+                track += 1
+                await hass.play(f"track {track}")
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
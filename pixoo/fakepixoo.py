@@ -0,0 +1,324 @@
+'''
+A simulated Pixoo64 for tests and benchmarks, no panel needed:
+
+    with FakePixoo64(latency=0.005) as fake:
+        pixoo = Pixoo64(fake.ip)
+        pixoo.url = fake.url
+        pixoo.send_local_image("dsotm1.jpg")
+        fake.image.show()
+
+FakeDivoomCloud stands in for app.divoom-gz.com the same way, point
+pixoo.remote at its url.
+'''
+import base64
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from setup_logger import logger
+
+
+class _FakePixooHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        fake = self.server.fake
+        request = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if fake.latency:
+            time.sleep(fake.latency)
+        answer = fake.answer(self.path, request)
+        if answer is None:
+            # a locked up panel or an offline cloud doesn't answer at all
+            self.close_connection = True
+            return
+
+        response = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeServer:
+    '''
+    Description: a threaded http server on localhost, answering with self.answer().
+    '''
+    def __init__(self, host, port):
+        self._server = ThreadingHTTPServer((host, port), _FakePixooHandler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def ip(self):
+        return self._server.server_address[0]
+
+    def answer(self, path, request):
+        '''
+        :param path: the path posted to
+        :param request: the body
+        :return: the decoded answer, or None to not answer
+        '''
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakePixoo64(_FakeServer):
+    '''
+    Description: serves /post on localhost and answers the commands PixooAPI
+        sends like a Pixoo64 does. Animations are decoded back into images.
+
+    :param host: the address to listen on
+    :param port: the port to listen on, 0 picks a free one
+    :param size: the panel size
+    :param latency: seconds added to every answer, to simulate the network and firmware
+    :param lockup: stop answering after refresh_limit animations without a
+        "Draw/ResetHttpGifId", like the firmware, until power_cycle()
+    :param refresh_limit: the animations the firmware survives without a reset
+    '''
+    def __init__(self, host="127.0.0.1", port=0, size=64, latency=0.0, lockup=False,
+                 refresh_limit=32):
+        self.size = size
+        self.latency = latency
+        self.lockup = lockup
+        self.refresh_limit = refresh_limit
+
+        self.commands = Counter()
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self.power_cycle()
+        super().__init__(host, port)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/post"
+
+    @property
+    def image(self):
+        '''
+        :return: the first frame of the animation on the panel, or None
+        '''
+        return self.frames.get(0)
+
+    def answer(self, path, request):
+        if self.locked:
+            return None
+        return self.handle(json.loads(request), len(request))
+
+    def power_cycle(self):
+        '''
+        Description: back to the power on state, this also clears a lockup.
+        '''
+        with self._lock:
+            self.locked = False
+            self.pic_id = 0
+            self.animations_since_reset = 0
+            self.frames = {}
+            self.pic_speed = None
+            self.texts = {}
+            self.items = {}
+            self.select_index = 0
+            self.settings = {
+                "Brightness": 100,
+                "RotationFlag": 0,
+                "ClockTime": 60,
+                "GalleryTime": 60,
+                "SingleGalleyTime": 5,
+                "PowerOnChannelId": 0,
+                "GalleryShowTimeFlag": 0,
+                "CurClockId": 0,
+                "Time24Flag": 1,
+                "TemperatureMode": 0,
+                "GyrateAngle": 0,
+                "MirrorFlag": 0,
+                "LightSwitch": 1,
+            }
+
+    def handle(self, data, size=0):
+        '''
+        :param data: the decoded command
+        :param size: the size of the request in bytes
+        :return: the answer to the command
+        '''
+        with self._lock:
+            self.bytes_received += size
+            return self._handle(data)
+
+    def _handle(self, data):
+        command = data.get("Command")
+        self.commands[command] += 1
+        handler = self._handlers.get(command)
+        if handler is None:
+            logger.debug(f"FakePixoo64 ignored {command}")
+            return {"error_code": 0}
+        result = handler(self, data) or {}
+        return {"error_code": 0, **result}
+
+    def _send_http_gif(self, data):
+        pic_id = data["PicID"]
+        if pic_id != self.pic_id:
+            self.pic_id = pic_id
+            self.frames = {}
+            self.texts = {}
+            self.items = {}
+            self.animations_since_reset += 1
+            if self.lockup and self.animations_since_reset > self.refresh_limit:
+                self.locked = True
+                logger.warning("FakePixoo64 locked up")
+
+        width = data["PicWidth"]
+        pixels = base64.b64decode(data["PicData"])
+        if len(pixels) != width * width * 3:
+            return {"error_code": 1}
+        self.frames[data["PicOffset"]] = Image.frombytes("RGB", (width, width), pixels)
+        self.pic_speed = data["PicSpeed"]
+
+    def _get_http_gif_id(self, data):
+        return {"PicId": self.pic_id + 1}
+
+    def _reset_http_gif_id(self, data):
+        self.pic_id = 0
+        self.animations_since_reset = 0
+
+    def _send_http_text(self, data):
+        self.texts[data["TextId"]] = data
+
+    def _clear_http_text(self, data):
+        self.texts = {}
+        self.items = {}
+
+    def _send_http_item_list(self, data):
+        for item in data["ItemList"]:
+            self.items[item["TextId"]] = item
+
+    def _command_list(self, data):
+        for command in data["CommandList"]:
+            result = self._handle(command)
+            if result["error_code"] != 0:
+                return result
+
+    def _get_all_conf(self, data):
+        return dict(self.settings)
+
+    def _setting(name, field="Mode"):
+        def handler(self, data):
+            self.settings[name] = data[field]
+        return handler
+
+    def _set_index(self, data):
+        self.select_index = data["SelectIndex"]
+
+    def _get_index(self, data):
+        return {"SelectIndex": self.select_index}
+
+    def _get_clock_info(self, data):
+        return {"ClockId": self.settings["CurClockId"], "Brightness": self.settings["Brightness"]}
+
+    def _get_device_time(self, data):
+        now = time.time()
+        return {"UTCTime": int(now), "LocalTime": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+    _handlers = {
+        "Draw/SendHttpGif": _send_http_gif,
+        "Draw/GetHttpGifId": _get_http_gif_id,
+        "Draw/ResetHttpGifId": _reset_http_gif_id,
+        "Draw/SendHttpText": _send_http_text,
+        "Draw/ClearHttpText": _clear_http_text,
+        "Draw/SendHttpItemList": _send_http_item_list,
+        "Draw/CommandList": _command_list,
+        "Channel/GetAllConf": _get_all_conf,
+        "Channel/SetIndex": _set_index,
+        "Channel/GetIndex": _get_index,
+        "Channel/GetClockInfo": _get_clock_info,
+        "Channel/SetClockSelectId": _setting("CurClockId", "ClockId"),
+        "Channel/SetBrightness": _setting("Brightness", "Brightness"),
+        "Channel/OnOffScreen": _setting("LightSwitch", "OnOff"),
+        "Device/SetScreenRotationAngle": _setting("GyrateAngle"),
+        "Device/SetMirrorMode": _setting("MirrorFlag"),
+        "Device/SetTime24Flag": _setting("Time24Flag"),
+        "Device/SetDisTempMode": _setting("TemperatureMode"),
+        "Device/GetDeviceTime": _get_device_time,
+    }
+    del _setting
+
+
+class FakeDivoomCloud(_FakeServer):
+    '''
+    Description: answers the app.divoom-gz.com endpoints PixooAPI uses with
+        canned answers.
+
+    :param host: the address to listen on
+    :param port: the port to listen on, 0 picks a free one
+    :param latency: seconds added to every answer
+    '''
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.offline = False
+        self.requests = Counter()
+        self.answers = {
+            "Device/ReturnSameLANDevice": {"DeviceList": [{
+                "DeviceName": "Pixoo64", "DeviceId": 300000001,
+                "DevicePrivateIP": host, "DeviceMac": "a8032a000001"}]},
+            "Channel/GetDialType": {"DialTypeList": ["Social", "normal", "Tools", "Sport",
+                                                    "Custom", "Holiday", "Game"]},
+            "Channel/GetDialList": {"TotalNum": 1, "DialList": [{"ClockId": 10, "Name": "Classic"}]},
+            "Device/GetTimeDialFontList": {"FontList": [
+                {"id": font, "name": f"font {font}", "width": "16", "high": "16",
+                 "charset": "", "type": 0} for font in range(8)]},
+            "Device/GetImgUploadList": {"ImgList": []},
+            "Device/GetImgLikeList": {"ImgList": []},
+        }
+        super().__init__(host, port)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def answer(self, path, request):
+        if self.offline:
+            return None
+        endpoint = path.lstrip("/")
+        self.requests[endpoint] += 1
+        return {"ReturnCode": 0, "ReturnMessage": "", **self.answers.get(endpoint, {})}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="serve a fake Pixoo64")
+    parser.add_argument("--port", type=int, default=8064)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--lockup", action="store_true")
+    args = parser.parse_args()
+
+    fake = FakePixoo64(port=args.port, latency=args.latency, lockup=args.lockup)
+    print(f"serving on {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
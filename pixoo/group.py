@@ -0,0 +1,146 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from PIL import Image
+
+from encoder import encode_buffer, frame_to_bytes
+from pixoo import Pixoo64
+from setup_logger import logger
+from transport import HTTPTransport, MAX_DOWNLOAD_SIZE, read_body
+
+
+class SendResult(NamedTuple):
+    device: object
+    ok: bool
+    seconds: float
+    error: Exception = None
+
+
+class PixooGroup:
+    '''
+    Description: broadcasts to several devices. Every asset is downloaded
+        and decoded once, every frame is encoded once per distinct (size,
+        rotation, mirror, sizing, color and dedupe settings), and the shared
+        payloads are sent to all members at the same time.
+
+    :param devices: a list of ip addresses or devices, ip addresses become Pixoo64
+    :param max_workers: the number of devices sent to at once, default is all of them
+    :param max_download_size: the largest image or gif downloaded, in bytes
+    '''
+    def __init__(self, devices, max_workers=None, max_download_size=MAX_DOWNLOAD_SIZE):
+        self.devices = [Pixoo64(device) if isinstance(device, str) else device
+                        for device in devices]
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(self.devices) or 1)
+        self._transport = HTTPTransport()
+        self._max_download_size = max_download_size
+
+    def close(self):
+        self._executor.shutdown()
+        self._transport.close()
+        for device in self.devices:
+            device.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _variant(device):
+        return (device._size, device._rotation, device._mirror, device._frame_key(),
+                device._dedupe_frames)
+
+    def _variants(self):
+        '''
+        :return: the devices grouped by (size, rotation, mirror, frame key,
+            dedupe), the frame key covers their sizing and color correction
+        '''
+        variants = {}
+        for device in self.devices:
+            variants.setdefault(self._variant(device), []).append(device)
+        return variants
+
+    def _run(self, call):
+        '''
+        Description: calls call(device) on every device in parallel and times it.
+
+        :return: a SendResult per device, in device order
+        '''
+        def timed(device):
+            start = time.perf_counter()
+            try:
+                call(device)
+            except Exception as e:
+                logger.error(f"{device._ip}: {e}")
+                return SendResult(device, False, time.perf_counter() - start, e)
+            return SendResult(device, True, time.perf_counter() - start)
+
+        return list(self._executor.map(timed, self.devices))
+
+    def _send_variant_frames(self, frames):
+        '''
+        :param frames: the encoded frames of each variant, see self._variants()
+        '''
+        return self._run(lambda device: device.send_frames(frames[self._variant(device)]))
+
+    def broadcast(self, command, *args, **kwargs):
+        '''
+        Description: runs the same command on every device, for example
+            group.broadcast("set_brightness", 50)
+
+        :return: a SendResult per device
+        '''
+        return self._run(lambda device: getattr(device, command)(*args, **kwargs))
+
+    def send_image(self, img):
+        '''
+        :param img: a PIL image
+        '''
+        frames = {}
+        prepared = {}
+        for key, devices in self._variants().items():
+            size, rotation, mirror, frame_key, _ = key
+            encoder = devices[0]
+            if (size, frame_key) not in prepared:
+                prepared[(size, frame_key)] = encoder.prepare_frame(img)
+            buffer = frame_to_bytes(prepared[(size, frame_key)], rotation, mirror)
+            frames[key] = [encoder._image_frame(encode_buffer(buffer))]
+        return self._send_variant_frames(frames)
+
+    def send_local_image(self, filename):
+        with Image.open(filename) as img:
+            return self.send_image(img)
+
+    def _download(self, url):
+        response = self._transport.get(url, headers={'User-Agent': 'null'}, stream=True)
+        return read_body(response, max_bytes=self._max_download_size)
+
+    def send_url_image(self, img_url):
+        with self._download(img_url) as body, Image.open(body) as img:
+            return self.send_image(img)
+
+    def send_gif(self, gif):
+        '''
+        :param gif: an opened gif
+        '''
+        frames = {}
+        for key, devices in self._variants().items():
+            gif.seek(0)
+            frames[key] = list(devices[0]._gif_frames(gif))
+        return self._send_variant_frames(frames)
+
+    def send_local_gif(self, filename):
+        with Image.open(filename) as gif:
+            return self.send_gif(gif)
+
+    def send_url_gif(self, url):
+        with self._download(url) as body, Image.open(body) as gif:
+            return self.send_gif(gif)
+
+
+if __name__ == "__main__":
+    with PixooGroup(["192.168.0.154", "192.168.0.155"]) as group:
+        for result in group.send_local_image("dsotm1.jpg"):
+            print(result.device._ip, result.ok, f"{result.seconds:.3f}s")
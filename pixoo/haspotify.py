@@ -1,7 +1,16 @@
+import asyncio
 import configparser
+import time
+from collections import Counter
 from requests import get
 from urllib.parse import urljoin
 
+import aiohttp
+from PIL import Image
+
+from encoder import encode_buffer, frame_to_bytes
+from setup_logger import logger
+
 
 class HASpotify:
     '''
@@ -10,20 +19,31 @@ class HASpotify:
     def __init__(self, **kwargs):
         config = configparser.ConfigParser()
         config.read("./config.ini")
-        homeassistant = config['homeassistant']
+        homeassistant = config['homeassistant'] if config.has_section('homeassistant') else {}
 
-        self.token = kwargs.get("token", homeassistant['token'])
-        self.interface = kwargs.get("interace", homeassistant['interface'])
-        entity_id = kwargs.get("entity_id", homeassistant['entity_id'])
+        def setting(name, *aliases):
+            for key in (name,) + aliases:
+                if key in kwargs:
+                    return kwargs[key]
+            # the example config quotes the token
+            return homeassistant[name].strip('"\'')
+
+        self.token = setting("token")
+        self.interface = setting("interface", "interace")
+        self.entity_id = setting("entity_id")
 
         url = urljoin(self.interface, 'api/states/')
-        self.url = urljoin(url, entity_id)
+        self.url = urljoin(url, self.entity_id)
 
         self.headers = {
             "Authorization": f"Bearer {self.token}",
             "content-type": "application/json",
         }
 
+    @property
+    def websocket_url(self):
+        return urljoin(self.interface.replace("http", "ws", 1), 'api/websocket')
+
     def album_cover_url(self):
         response = get(self.url, headers=self.headers)
         try:
@@ -33,5 +53,146 @@ class HASpotify:
         return self.cover_url
 
 
+class AlbumArtSync:
+    '''
+    Description: keeps the album cover on a device in sync with a Home
+        Assistant media player, for as long as it runs. It subscribes to
+        the state of the player over the websocket api, and only when the
+        entity_picture changes it downloads and encodes the cover, right
+        away, and sends it. A cover that is replaced before it was sent is
+        dropped. The connection is made again when it's lost.
+
+        stats counts the events, the covers sent, the events skipped because
+        the cover didn't change, and the errors. latency is the seconds
+        from the last change to the cover being on the panel.
+
+    :param device: the AsyncPixooDevice to draw on
+    :param haspotify: the HASpotify with the connection settings, default
+        reads config.ini
+    :param reconnect_delay: seconds before connecting again, doubled on each
+        failure up to max_reconnect_delay
+
+    example:
+        asyncio.run(AlbumArtSync(AsyncPixoo64("192.168.0.154")).run())
+    '''
+    def __init__(self, device, haspotify=None, reconnect_delay=1.0, max_reconnect_delay=60.0):
+        self.device = device
+        self.haspotify = haspotify or HASpotify()
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.stats = Counter()
+        self.latency = None
+        self._wanted = None
+        self._task = None
+        self._send_lock = asyncio.Lock()
+
+    async def run(self):
+        '''
+        Description: syncs until cancelled.
+        '''
+        delay = self.reconnect_delay
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._listen(session)
+                    delay = self.reconnect_delay
+                    logger.warning("Home Assistant closed the connection")
+                except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Home Assistant connection failed: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _listen(self, session):
+        ha = self.haspotify
+        async with session.ws_connect(ha.websocket_url, heartbeat=30) as ws:
+            await self._receive(ws)  # auth_required
+            await ws.send_json({"type": "auth", "access_token": ha.token})
+            message = await self._receive(ws)
+            if message.get("type") != "auth_ok":
+                raise PermissionError(f"Home Assistant refused the token: {message.get('message')}")
+
+            await ws.send_json({"id": 1,
+                                "type": "subscribe_trigger",
+                                "trigger": {"platform": "state", "entity_id": ha.entity_id}})
+            # the state can have changed while disconnected
+            async with session.get(ha.url, headers=ha.headers) as response:
+                if response.status == 200:
+                    self._on_state(await response.json())
+            logger.info(f"Syncing the album cover of {ha.entity_id}")
+
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = message.json()
+                if data.get("type") == "event" and data.get("id") == 1:
+                    self._on_state(data["event"]["variables"]["trigger"]["to_state"])
+                elif data.get("type") == "result" and not data.get("success"):
+                    logger.error(f"Home Assistant error: {data.get('error')}")
+
+    @staticmethod
+    async def _receive(ws):
+        '''
+        :return: the next message of the handshake, decoded
+        :raise ConnectionError: when the socket is closed instead, like while
+            Home Assistant restarts
+        '''
+        message = await ws.receive()
+        if message.type != aiohttp.WSMsgType.TEXT:
+            raise ConnectionError(f"Home Assistant sent {message.type.name} during the handshake")
+        return message.json()
+
+    def _on_state(self, state):
+        self.stats["events"] += 1
+        picture = ((state or {}).get("attributes") or {}).get("entity_picture")
+        if picture is None or picture == self._wanted:
+            self.stats["skipped"] += 1
+            return
+
+        self._wanted = picture
+        if self._task is not None and not self._task.done():
+            # a newer track, the older cover is not worth sending
+            self._task.cancel()
+        self._task = asyncio.create_task(self._update(picture, time.perf_counter()))
+
+    def _encode(self, body):
+        device = self.device
+        with body, Image.open(body) as img:
+            frame = device.prepare_frame(img)
+            return encode_buffer(frame_to_bytes(frame, device._rotation, device._mirror))
+
+    async def _update(self, picture, start):
+        try:
+            body = await self.device._download(urljoin(self.haspotify.interface, picture))
+            pic_data = await asyncio.to_thread(self._encode, body)
+            async with self._send_lock:
+                if picture != self._wanted:
+                    return
+                await self.device.send_frames([self.device._image_frame(pic_data)])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            # forget it, so the next event with this cover tries again
+            if picture == self._wanted:
+                self._wanted = None
+            logger.error(f"Could not send the album cover: {e!r}")
+            return
+        self.stats["sent"] += 1
+        self.latency = time.perf_counter() - start
+        logger.debug(f"Album cover sent in {self.latency:.3f}s")
+
+
 if __name__=="__main__":
-    sp = HASpotify()
\ No newline at end of file
+    import argparse
+
+    from asyncpixoo import AsyncPixoo64
+
+    parser = argparse.ArgumentParser(description="keep the album cover on a Pixoo64 in sync")
+    parser.add_argument("ip", help="the ip of the Pixoo64")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(AlbumArtSync(AsyncPixoo64(args.ip)).run())
+    except KeyboardInterrupt:
+        pass
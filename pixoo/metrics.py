@@ -0,0 +1,126 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# seconds, like the prometheus client defaults, finer at the low end
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    '''
+    Description: counts observations into fixed buckets, cumulated on export.
+    '''
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        :return: (upper bound, observations at or below it) for every bucket and +Inf
+        '''
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    '''
+    Description: counters and latency histograms for the requests a client
+        makes. Pass one as metrics= to a device, it can be shared between
+        devices. Without one, the hot path only pays for an "is None" check.
+
+        stages timed:
+            encode: a frame to a base64 buffer
+            serialize: a command to json
+            network: the post and reading the response
+
+    :param buckets: the histogram bucket bounds, in seconds
+    '''
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.requests = Counter()
+        self.bytes_sent = Counter()
+        self.errors = Counter()
+        self.retries = Counter()
+        self.skipped = Counter()
+        self.latency = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        '''
+        :param callback: called as callback(stage, command, seconds) for every
+            observation, from the thread that made it
+        '''
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def observe(self, stage, command, seconds):
+        with self._lock:
+            histogram = self.latency.get((stage, command))
+            if histogram is None:
+                histogram = self.latency[(stage, command)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        for callback in self._callbacks:
+            callback(stage, command, seconds)
+
+    def request(self, command, size):
+        with self._lock:
+            self.requests[command] += 1
+            self.bytes_sent[command] += size
+
+    def error(self, command, code):
+        with self._lock:
+            self.errors[(command, code)] += 1
+
+    def retry(self, command):
+        with self._lock:
+            self.retries[command] += 1
+
+    def skip(self, command):
+        with self._lock:
+            self.skipped[command] += 1
+
+    def prometheus(self, prefix="pixoo"):
+        '''
+        :return: every metric in the prometheus text exposition format
+        '''
+        lines = []
+
+        def counter(name, help, values, labels):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for key, value in sorted(values.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                label = ",".join(f'{l}="{v}"' for l, v in zip(labels, key))
+                lines.append(f"{prefix}_{name}{{{label}}} {value}")
+
+        with self._lock:
+            counter("requests_total", "Requests sent.", self.requests, ("command",))
+            counter("request_bytes_total", "Request bytes sent.", self.bytes_sent, ("command",))
+            counter("errors_total", "Responses with an error code.", self.errors, ("command", "code"))
+            counter("retries_total", "Requests sent again.", self.retries, ("command",))
+            counter("skipped_total", "Requests not sent, the panel already showed it.",
+                    self.skipped, ("command",))
+
+            name = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Seconds spent per stage.")
+            lines.append(f"# TYPE {name} histogram")
+            for (stage, command), histogram in sorted(self.latency.items()):
+                label = f'stage="{stage}",command="{command}"'
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{label},le="{le}"}} {count}')
+                lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Prefetcher:
+    '''
+    Description: runs an iterator in a worker thread, up to depth items ahead
+        of the consumer, so producing the next item overlaps with using the
+        last one. Items come out in order. An exception in the worker is
+        raised in the consumer.
+
+        After iterating, stats holds the seconds spent in each stage:
+            produce: the worker producing items
+            consume: the consumer between two items
+            wait: the consumer waiting for the worker
+            total: from the first to the last item
+
+    :param iterable: what to prefetch, for example PixooFrames._gif_frames()
+    :param depth: the most items produced ahead
+    '''
+    def __init__(self, iterable, depth=8):
+        self._iterator = iter(iterable)
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._produce = 0.0
+        self.stats = {}
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _work(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(self._iterator)
+                except StopIteration:
+                    break
+                self._produce += time.perf_counter() - start
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put((_DONE, e))
+            return
+        self._put((_DONE, None))
+
+    def __iter__(self):
+        worker = threading.Thread(target=self._work, name="pixoo-prefetch", daemon=True)
+        worker.start()
+
+        wait = consume = 0.0
+        begin = last = time.perf_counter()
+        try:
+            while True:
+                start = time.perf_counter()
+                consume += start - last
+                item = self._queue.get()
+                last = time.perf_counter()
+                wait += last - start
+                if isinstance(item, tuple) and item and item[0] is _DONE:
+                    if item[1] is not None:
+                        raise item[1]
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            worker.join()
+            self.stats = {
+                "produce": self._produce,
+                "consume": consume,
+                "wait": wait,
+                "total": time.perf_counter() - begin,
+            }
@@ -1,90 +1,259 @@
-import base64
+import hashlib
 import json
-import re
-import requests
-from urllib.parse import urljoin
+import logging
+import threading
+from time import monotonic, perf_counter
+from urllib.parse import urlencode, urljoin
 
 # for images
-from PIL import Image, ImageOps
-
-# for url images
-from io import BytesIO
-
+from PIL import Image
+
+from cache import REMOTE_CACHE, content_hash
+from color import ColorStage
+from encoder import array_to_bytes, frame_to_bytes, encode_buffer
+from pipeline import Prefetcher
+from responses import RESULT_TYPES, REMOTE_RESULT_TYPES, Response, RemoteResponse, parse, snake_case
+from sampler import sample_gif
+from sizing import MODES, fit_frame, make_square
 from setup_logger import logger
+from state import PANEL_COMMANDS, DeviceState
+from transport import HTTPTransport, MAX_DOWNLOAD_SIZE, read_body
 
 
 class PixooAPI:
     # http://doc.divoom-gz.com/web/#/12?page_id=143
     __refresh_limit = 32
 
-    def __init__(self, ip, size=None, refresh=True):
+    def __init__(self, ip, size=None, refresh=True, transport=None, metrics=None, remote_cache=None,
+                 state_max_age=30.0):
+        '''
+        :param state_max_age: seconds the settings read or set are trusted,
+            see state.DeviceState, 0 always asks the device
+        '''
         self._ip = ip
         self._size = size
         self._refresh = refresh
-        self.buffer = []
+        self._transport = transport or HTTPTransport()
+        self._metrics = metrics
+        self._remote_cache = REMOTE_CACHE if remote_cache is None else remote_cache
+        self._pic_id = None
+        # taking a PicID and sending the first frame with it, for threads sharing the device
+        self._pic_id_lock = threading.RLock()
+        # the key of the animation on the panel and when it was sent, see PixooFrames._unchanged()
+        self._shown = None
+        self.buffer = b''
+
+        # the last value of every answered field, for the attr_* names
+        self._attrs = {}
+        # the settings the getters answer from, kept up to date by the setters
+        self.state = DeviceState(state_max_age)
 
         self.url = f'http://{ip}:80/post'
         self.remote = "https://app.divoom-gz.com/"
 
+    def __getattr__(self, name):
+        '''
+        Description: the attr_* names of the fields of earlier answers, like
+            self.attr_select_index. The commands return their results, prefer those.
+        '''
+        if name.startswith("attr_"):
+            try:
+                return self.__dict__["_attrs"][name[5:]]
+            except KeyError:
+                pass
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def refresh_limit(self):
+        return self.__refresh_limit
+
+    def _needs_refresh(self):
+        '''
+        :return: True when the PicID should be reset before sending, the firmware
+            locks up after about refresh_limit animations without a reset
+        '''
+        return self._refresh and self._pic_id >= self.__refresh_limit
+
+    def _next_pic_id(self):
+        '''
+        Description: the PicID for the next animation. It's counted locally, the
+            device is only asked the first time and after the counter drifted.
+        '''
+        with self._pic_id_lock:
+            if self._pic_id is None:
+                self._pic_id = self.get_sending_animation_pic_id().pic_id - 1
+            self._pic_id += 1
+            if self._needs_refresh():
+                logger.debug(f"Resetting PicID at {self._pic_id}")
+                self.reset_sending_animation_pic_id()
+                self._pic_id = 1
+            return self._pic_id
+
+    def invalidate_frame(self):
+        '''
+        Description: forgets which animation is on the panel, so the next one
+            is sent even if it's the same. Call it when another client, like
+            the Divoom app, changed the panel.
+        '''
+        self._shown = None
+
     def clamp(self, n, minn, maxn):
         return max(min(maxn, n), minn)
 
+    def close(self):
+        '''
+        Description: closes the pooled connections of the transport.
+        '''
+        self._transport.close()
+
     def __post(self, url, data=None):
-        response = requests.post(url, data)
+        response = self._transport.post(url, data)
         if response.status_code != 200:
             logger.warning(f"Bad Response Code: {response.status_code}")
         return response
 
-    def __local_error(self):
-        self.__error(self.attr_error_code)
+    def __error(self, code):
+        if code != 0:
+            logger.error(f"There was an error: {code}")
 
-    def __remote_error(self):
-        self.__error(self.attr_return_code)
+    def _handle_remote_response(self, response, url=None):
+        '''
+        :param response: the decoded answer
+        :param url: the remote command, which picks the result type
+        :return: the answer as a result from responses.py
+        '''
+        self._set_attribute_from_response(response)
+        result = parse(REMOTE_RESULT_TYPES.get(url, RemoteResponse), response)
+        self.__error(result.return_code)
+        return result
 
-    def __error(self, attribute):
-        if attribute != 0:
-            logger.error(f"There was an error: {attribute}")
+    def _handle_local_response(self, response, command=None):
+        '''
+        :param response: the decoded answer
+        :param command: the local command, which picks the result type
+        :return: the answer as a result from responses.py
+        '''
+        self._set_attribute_from_response(response)
+        if command in PANEL_COMMANDS:
+            self._shown = None
+        result = parse(RESULT_TYPES.get(command, Response), response)
+        self.__error(result.error_code)
+        return result
+
+    def _observe_post(self, command, body, start, sent, response, error_key):
+        '''
+        Description: records a post in the metrics.
+
+        :param command: the command, or the remote endpoint
+        :param body: the serialized request
+        :param start: perf_counter() before serializing, None when the
+            transport serializes it and it isn't timed
+        :param sent: perf_counter() before posting
+        :param response: the decoded response
+        :param error_key: the response field holding the error code
+        '''
+        metrics = self._metrics
+        metrics.request(command, len(body or ''))
+        if start is not None:
+            metrics.observe("serialize", command, sent - start)
+        metrics.observe("network", command, perf_counter() - sent)
+        code = response.get(error_key, 0)
+        if code:
+            metrics.error(command, code)
+
+    @staticmethod
+    def _remote_body(data):
+        '''
+        :return: the form body the transport posts for a remote request, for the metrics
+        '''
+        return urlencode(data or {}, doseq=True)
 
     def __remote_post(self, url, data=None):
-        response = self.__post(url, data)
-        self._set_attribute_from_response(response.json())
-        self.__remote_error()
+        if self._metrics is None:
+            return self.__post(urljoin(self.remote, url), data).json()
 
-    def _remote_post(self, url=None, data=None):
-        url = urljoin(self.remote, url)
-        self.__remote_post(url, data)
+        sent = perf_counter()
+        response = self.__post(urljoin(self.remote, url), data).json()
+        self._observe_post(url, self._remote_body(data), None, sent, response, 'ReturnCode')
+        return response
+
+    def _remote_post(self, url=None, data=None, wait=True):
+        '''
+        :param url: the remote command
+        :param data: the request
+        :param wait: when the answer isn't cached, False asks for it in the
+            background and returns None instead of waiting
+        '''
+        if not self._remote_cache.caches(url):
+            return self._handle_remote_response(self.__remote_post(url, data), url)
+
+        response = self._remote_cache.get(url, data, lambda: self.__remote_post(url, data), wait)
+        if response is None:
+            return None
+        return self._handle_remote_response(response, url)
 
     def __local_post(self, url=None, data=None):
-        response = self.__post(url=url, data=json.dumps(data))
-        self._set_attribute_from_response(response.json())
-        self.__local_error()
+        if self._metrics is None:
+            return self.__post(url=url, data=json.dumps(data)).json()
+
+        start = perf_counter()
+        body = json.dumps(data)
+        sent = perf_counter()
+        response = self.__post(url=url, data=body).json()
+        self._observe_post(data.get("Command"), body, start, sent, response, 'error_code')
+        return response
 
     def _local_post(self, data=None):
-        self.__local_post(url=self.url, data=data)
+        result = self._from_state(data)
+        if result is not None:
+            return result
+        result = self._handle_local_response(self.__local_post(url=self.url, data=data), data.get("Command"))
+        self.state.update(data, result)
+        return result
 
-    def __camel_to_snake(self, camel):
-        pattern = re.compile(r'(?<!^)(?=[A-Z])')
-        snake = pattern.sub('_', camel).lower()
-        return snake
+    def _from_state(self, data):
+        '''
+        :return: the result of a local command from self.state, or None when it has to be posted
+        '''
+        result = self.state.cached(data)
+        if result is not None:
+            logger.debug(f"Answered {data['Command']} from the device state")
+            if self._metrics is not None:
+                self._metrics.skip(data["Command"])
+        return result
+
+    def refresh_state(self):
+        '''
+        Description: reads the settings and the channel from the device
+            again, instead of waiting for them to get older than state_max_age.
+
+        :return: the settings, like self.get_all_setting()
+        '''
+        self.state.invalidate()
+        self.get_current_channel()
+        return self.get_all_setting()
 
     def _set_attribute_from_response(self, response):
-        for key in response:
-            snake = self.__camel_to_snake(key)
-            snake = "_".join(("attr", snake))
-            setattr(self, snake, response[key])
-            logger.debug(f"Attribute Set: self.{snake} = {response[key]}")
+        '''
+        Description: keeps the fields of the answer for the attr_* names.
+        '''
+        attrs = {snake_case(key): value for key, value in response.items()}
+        self._attrs.update(attrs)
+        if logger.isEnabledFor(logging.DEBUG):
+            for snake, value in attrs.items():
+                logger.debug(f"Attribute Set: self.attr_{snake} = {value}")
 
     def find_device(self):
         '''
         Description: get the device list in local network.
         '''
-        self._remote_post(url="Device/ReturnSameLANDevice")
+        return self._remote_post(url="Device/ReturnSameLANDevice")
 
     def dial_type(self):
         '''
         Description: select dial type.
         '''
-        self._remote_post(url="Channel/GetDialType")
+        return self._remote_post(url="Channel/GetDialType")
 
     def dial_list(self, dial_type=None, page=1):
         '''
@@ -93,13 +262,12 @@ class PixooAPI:
         :param dial_type: dial type, returned from self.dial_type()
         :param page: the number of pages, for example 1, Notes: 30 per page (???)
         '''
-        if not hasattr(self, 'attr_dial_type_list'):
-            self.dial_type()
-        if dial_type not in self.attr_dial_type_list:
-            print(f"invalid dial type: {dial_type}; available: {self.attr_dial_type_list}")
+        dial_types = self.dial_type().dial_type_list
+        if dial_type not in dial_types:
+            print(f"invalid dial type: {dial_type}; available: {dial_types}")
             return
         data = {"DialType": dial_type, "Page": page}
-        self._remote_post(url="Channel/GetDialList", data=data)
+        return self._remote_post(url="Channel/GetDialList", data=data)
 
     def select_faces_channel(self, clock_id):
         '''
@@ -108,14 +276,14 @@ class PixooAPI:
         :param clock_id: face id
         '''
         data = {"Command": "Channel/SetClockSelectId", "ClockId": clock_id}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_select_face_id(self):
         '''
         Description: Get working Faces id.
         '''
         data = {"Command": "Channel/GetClockInfo"}
-        self._local_post(data)
+        return self._local_post(data)
 
     def select_channel(self, select_index):
         '''
@@ -129,7 +297,7 @@ class PixooAPI:
             4: Black Screen
         '''
         data = {"Command": "Channel/SetIndex", "SelectIndex": select_index}
-        self._local_post(data)
+        return self._local_post(data)
 
     def control_custom_channel(self, custom_page_index):
         '''
@@ -138,7 +306,7 @@ class PixooAPI:
         :param custom_page_index: custom index, 0 to 2
         '''
         data = {"Command": "Channel/SetCustomPageIndex", "CustomPageIndex": custom_page_index}
-        self._local_post(data)
+        return self._local_post(data)
 
     def visualizer_channel(self, eq_position=0):
         '''
@@ -147,7 +315,7 @@ class PixooAPI:
         :param eq_position: index, start from 0
         '''
         data = {"Command": "Channel/SetEqPosition", "EqPosition": eq_position}
-        self._local_post(data)
+        return self._local_post(data)
 
     def cloud_channel(self, index):
         '''
@@ -160,7 +328,7 @@ class PixooAPI:
             3: Album
         '''
         data = {"Command": "Channel/CloudIndex", "Index": index}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_current_channel(self):
         '''
@@ -174,8 +342,7 @@ class PixooAPI:
             4: Black Screen
         '''
         data = {"Command": "Channel/GetIndex"}
-        self._local_post(data)
-        return self.attr_select_index
+        return self._local_post(data).select_index
 
     def set_brightness(self, brightness):
         '''
@@ -185,7 +352,7 @@ class PixooAPI:
         '''
         brightness = self.clamp(brightness, 0, 100)
         data = {"Command": "Channel/SetBrightness", "Brightness": brightness}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_all_setting(self):
         '''
@@ -205,7 +372,7 @@ class PixooAPI:
             light_switch: the screen switch
         '''
         data = {"Command": "Channel/GetAllConf"}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_weather_area(self, latitude, longitude):
         '''
@@ -216,7 +383,7 @@ class PixooAPI:
         :param longitude: longitude
         '''
         data = {"Command": "Sys/LogAndLat", "Latitude": latitude, "Longitude": longitude}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_time_zone(self, time_zone_value):
         '''
@@ -225,7 +392,7 @@ class PixooAPI:
         :param time_zone_value: time zone value
         '''
         data = {"Command": "Sys/TimeZone", "TimeZoneValue": time_zone_value}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_system_time(self, utc):
         '''
@@ -234,7 +401,7 @@ class PixooAPI:
         :param utc: utc time
         '''
         data = {"Command": "Device/SetUTC", "Utc": utc}
-        self._local_post(data)
+        return self._local_post(data)
 
     def screen_switch(self, on_off):
         '''
@@ -243,7 +410,7 @@ class PixooAPI:
         :param OnOff: 1: on, 0: off
         '''
         data = {"Command": "Channel/OnOffScreen", "OnOff": on_off}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_device_time(self):
         '''
@@ -251,7 +418,7 @@ class PixooAPI:
             it will be active after 90107.
         '''
         data = {"Command": "Device/GetDeviceTime"}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_temperature_mode(self, mode):
         '''
@@ -260,7 +427,7 @@ class PixooAPI:
         :param mode: 0: Celsius, 1: Fahrenheit
         '''
         data = {"Command": "Device/SetDisTempMode", "Mode": mode}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_rotation_angle(self, mode):
         '''
@@ -269,7 +436,7 @@ class PixooAPI:
         :param mode: 0:normal, 1:90; 2:180; 3:270
         '''
         data = {"Command": "Device/SetScreenRotationAngle", "Mode": mode}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_mirror_mode(self, mode):
         '''
@@ -278,7 +445,7 @@ class PixooAPI:
         :param mode: 0:disable; 1:enable
         '''
         data = {"Command": "Device/SetMirrorMode", "Mode": mode}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_hour_mode(self, mode):
         '''
@@ -287,7 +454,7 @@ class PixooAPI:
         :param mode: 1:24-hour;0:12-hour
         '''
         data = {"Command": "Device/SetTime24Flag", "Mode": mode}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_hight_light_mode(self, mode):
         '''
@@ -296,7 +463,7 @@ class PixooAPI:
         :param mode: 0:close; 1:open
         '''
         data = {"Command": "Device/SetHighLightMode", "Mode": mode}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_white_balance(self, r_value, g_value, b_value):
         '''
@@ -309,18 +476,18 @@ class PixooAPI:
         r_value = self.clamp(r_value, 0, 100)
         g_value = self.clamp(g_value, 0, 100)
         b_value = self.clamp(b_value, 0, 100)
-        data = {"Command": "Device/SetHighLightMode",
+        data = {"Command": "Device/SetWhiteBalance",
                 "RValue": r_value,
                 "GValue": g_value,
                 "BValue": b_value}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_weather_info(self):
         '''
         Description: it will get the display weather information of the device.
         '''
         data = {"Command": "Device/GetWeatherInfo"}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_countdown_tool(self, minute, second, status):
         '''
@@ -334,7 +501,7 @@ class PixooAPI:
                 "Minute": minute,
                 "Second": second,
                 "Status": status}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_stopwatch_tool(self, status):
         '''
@@ -346,7 +513,7 @@ class PixooAPI:
         '''
         data = {"Command": "Tools/SetStopWatch",
                 "Status": status}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_scoreboard_tool(self, blue_score, red_score):
         '''
@@ -358,7 +525,7 @@ class PixooAPI:
         data = {"Command": "Tools/SetScoreBoard",
                 "BlueScore": blue_score,
                 "RedScore": red_score}
-        self._local_post(data)
+        return self._local_post(data)
 
     def set_noise_tool(self, noise_status):
         '''
@@ -368,7 +535,7 @@ class PixooAPI:
         '''
         data = {"Command": "Tools/SetScoreBoard",
                 "NoiseStatus": noise_status}
-        self._local_post(data)
+        return self._local_post(data)
 
     def play_gif(self, filetype, filename):
         '''
@@ -382,7 +549,7 @@ class PixooAPI:
         data = {"Command": "Device/PlayTFGif",
                 "FileType": filetype,
                 "FileName": filename}
-        self._local_post(data)
+        return self._local_post(data)
 
     def get_sending_animation_pic_id(self):
         '''
@@ -391,14 +558,15 @@ class PixooAPI:
             the command will be implemented after the 90095 version.
         '''
         data = {"Command": "Draw/GetHttpGifId"}
-        self._local_post(data)
+        return self._local_post(data)
 
     def reset_sending_animation_pic_id(self):
         '''
         Description: it will reset gif id , “Send animation” will start from PicID=1.
         '''
         data = {"Command": "Draw/ResetHttpGifId"}
-        self._local_post(data)
+        self._pic_id = 0
+        return self._local_post(data)
 
     def send_animation(self, pic_num=1, pic_width=64, pic_offset=0, pic_id=0, pic_speed=60, pic_data=None):
         '''
@@ -423,7 +591,7 @@ class PixooAPI:
             "PicSpeed": pic_speed,
             "PicData": pic_data,
         }
-        self._local_post(data)
+        return self._local_post(data)
 
     def send_text(self, text_id, x, y, dirr, font, text_width, text_string, speed, color, align):
         '''
@@ -451,16 +619,30 @@ class PixooAPI:
 
         example: self.send_text(0, 0, 0, 0, 0, 64, "Hello World", 0, "#FFFF00", 2)
         '''
-        if not hasattr(self, 'attr_font_list'):
-            self.get_font_list()
-        for _font in self.attr_font_list:
+        # the text is drawn even when the cloud is slow, the font is checked once it answered
+        font_list = self.get_font_list(wait=False)
+        if font_list is not None:
+            self._check_font(font, font_list.font_list)
+
+        data = self.text_command(text_id, x, y, dirr, font, text_width, text_string, speed, color, align)
+        return self._local_post(data)
+
+    @staticmethod
+    def _check_font(font, font_list):
+        for _font in font_list:
             if _font['id'] == font:
                 break
         else:
             print(f"font {font} not found in font list.")
             print("something will still be displayed though.")
 
-        data = {
+    @staticmethod
+    def text_command(text_id, x, y, dirr, font, text_width, text_string, speed, color, align):
+        '''
+        :return: the "Draw/SendHttpText" command, see self.send_text(), for
+            example for self.command_list()
+        '''
+        return {
             "Command": "Draw/SendHttpText",
             "TextId": text_id,
             "x": x,
@@ -473,7 +655,6 @@ class PixooAPI:
             "color": color,
             "align": align,
         }
-        self._local_post(data)
 
     def clear_all_text_area(self):
         '''
@@ -482,13 +663,69 @@ class PixooAPI:
         data = {
             "Command": "Draw/ClearHttpText"
         }
-        self._local_post(data)
+        return self._local_post(data)
 
-    def get_font_list(self):
-        self._remote_post(url="Device/GetTimeDialFontList")
+    def get_font_list(self, wait=True):
+        '''
+        :param wait: when the list isn't cached, False returns None at once
+            and asks for it in the background
+        '''
+        return self._remote_post(url="Device/GetTimeDialFontList", wait=wait)
 
-    def send_display_list(self, item_list, text_id, type, x, y, dir, font, text_width, text_height, text_string, speed, color, update_time, align):
-        pass
+    def send_display_list(self, item_list=None, text_id=None, type=None, x=0, y=0, dir=0, font=0,
+                          text_width=64, text_height=16, text_string="", speed=100,
+                          color="#FFFFFF", update_time=60, align=1):
+        '''
+        Description: it will add display items to the current animation, text or
+            values the device keeps up to date itself (time, date, weather, ...).
+            the command will be active after sending animation(the “Draw/SendHttpGif” comand).
+
+        :param item_list: a list of items, see self.display_item()
+        :param text_id: when given, one more item is added to item_list from the
+            remaining parameters
+        '''
+        item_list = list(item_list or [])
+        if text_id is not None:
+            item_list.append(self.display_item(text_id, type, x, y, dir, font, text_width,
+                                                text_height, text_string, speed, color,
+                                                update_time, align))
+        data = {"Command": "Draw/SendHttpItemList", "ItemList": item_list}
+        return self._local_post(data)
+
+    @staticmethod
+    def display_item(text_id, type, x=0, y=0, dir=0, font=0, text_width=64, text_height=16,
+                     text_string="", speed=100, color="#FFFFFF", update_time=60, align=1):
+        '''
+        :param text_id: the item id, smaller than 40, replaced with the same ID
+        :param type: the item type, for example 1: second, 5: time hour:minute, 22: text string
+        :param x: the start x postion
+        :param y: the start y postion
+        :param dir: direction of scroll, 0: scroll left, 1: scroll right
+        :param font: the font id
+        :param text_width: the text width, 16 to 64
+        :param text_height: the text height, 16 to 64
+        :param text_string: the text, only used by text string items
+        :param speed: the scroll speed, the time (ms) the text move one step
+        :param color: the font color, eg:#FFFF00
+        :param update_time: seconds between the device refreshing a network item
+        :param align: horizontal text alignment, 1: left; 2: middle; 3: right
+        :return: an item for self.send_display_list()
+        '''
+        return {
+            "TextId": text_id,
+            "type": type,
+            "x": x,
+            "y": y,
+            "dir": dir,
+            "font": font,
+            "TextWidth": text_width,
+            "Textheight": text_height,
+            "TextString": text_string,
+            "speed": speed,
+            "color": color,
+            "update_time": update_time,
+            "align": align,
+        }
 
     def play_buzzer(self, active_time_in_cycle, off_time_in_cycle, play_total_time):
         '''
@@ -502,50 +739,61 @@ class PixooAPI:
                 "ActiveTimeInCycle": active_time_in_cycle,
                 "OffTimeInCycle": off_time_in_cycle,
                 "PlayTotalTime": play_total_time}
-        self._local_post(data)
+        return self._local_post(data)
 
     def play_divoom_gif(self, file_id):
         pass
 
     def get_img_upload_list(self, device_id=None, device_mac=None, page=1):
-        if not hasattr(self, 'attr_device_list'):
-            self.find_device()
-        data = {"DeviceId": device_id or self.attr_device_list[0]['DeviceId'],
-                "DeviceMac": device_mac or self.attr_device_list[0]['DeviceMac'],
+        if device_id is None or device_mac is None:
+            device = self.find_device().device_list[0]
+            device_id = device_id or device['DeviceId']
+            device_mac = device_mac or device['DeviceMac']
+        data = {"DeviceId": device_id,
+                "DeviceMac": device_mac,
                 "Page": page}
-        self._remote_post(url="Device/GetImgUploadList", data=data)
+        return self._remote_post(url="Device/GetImgUploadList", data=data)
 
     def get_my_like_img_list(self, device_id, device_mac, page):
         pass
 
     def command_list(self, command_list):
-        pass
+        '''
+        Description: it will run several commands with a single post.
+
+        :param command_list: a list of commands, each one the data of a single command
+        '''
+        data = {"Command": "Draw/CommandList", "CommandList": command_list}
+        return self._local_post(data)
 
     def url_command_file(self, command_file):
         pass
 
 
-class PixooDevice(PixooAPI):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-
-    def screen_switch_on(self):
-        '''
-        turns off the screen
-        '''
-        self.screen_switch(on_off=1)
-
-    def screen_switch_off(self):
-        '''
-        turns on the screen
-        '''
-        self.screen_switch(on_off=0)
+class PixooFrames:
+    '''
+    frame preparation and encoding, shared by the sync and async devices.
+    nothing in here talks to the device.
+    '''
+    _rotation = 0
+    _mirror = 0
+    _metrics = None
+    _animation_cache = None
+    _dedupe_frames = False
+    _color_stage = None
+    _sizing = ("letterbox", (0, 0, 0), None)
+    # idle suppression, see self._unchanged()
+    _skip_unchanged = False
+    _resend_after = None
+    skipped_sends = 0
+    # frames encoded ahead of the upload, 0 encodes and sends one at a time
+    _pipeline_depth = 8
 
     def clear_buffer(self):
         '''
         clears the buffer.
         '''
-        self.buffer = []
+        self.buffer = b''
 
     def set_buffer(self, buffer):
         '''
@@ -559,23 +807,286 @@ class PixooDevice(PixooAPI):
         :param frame: a single image frame,
             this can be either an image or a frame from a gif
         '''
-        if frame.mode != 'RGB':
-            frame = frame.convert("RGB")
-        buffer = []
-        size_x, size_y = frame.size
-        for x in range(size_x):
-            for y in range(size_y):
-                r, g, b = frame.getpixel((x, y))
-                buffer.append(r)
-                buffer.append(g)
-                buffer.append(b)
-        self.set_buffer(buffer)
+        self.set_buffer(self.frame_to_buffer(frame))
+
+    def frame_to_buffer(self, frame):
+        '''
+        :param frame: a prepared frame, see self.prepare_frame()
+        :return: its device bytes, in the software orientation
+        '''
+        if self._metrics is None:
+            return frame_to_bytes(frame, self._rotation, self._mirror)
+        start = perf_counter()
+        buffer = frame_to_bytes(frame, self._rotation, self._mirror)
+        self._metrics.observe("encode", "frame", perf_counter() - start)
+        return buffer
+
+    def set_buffer_from_canvas(self, canvas):
+        '''
+        :param canvas: a canvas.Canvas of the device size. Without a software
+            orientation the buffer is a view of its pixels, not a copy.
+        '''
+        self.set_buffer(array_to_bytes(canvas.pixels, self._rotation, self._mirror))
+
+    def set_orientation(self, rotation=0, mirror=0):
+        '''
+        Description: sets the orientation applied in software when a frame is
+            turned into a buffer. It costs the same as sending unrotated.
+
+        :param rotation: 0:normal, 1:90; 2:180; 3:270
+        :param mirror: 0:disable; 1:enable
+        '''
+        self._rotation = rotation % 4
+        self._mirror = int(bool(mirror))
+
+    def set_color_correction(self, gamma=1.0, white_balance=None, brightness=None,
+                             dither=None, **kwargs):
+        '''
+        Description: sets the color processing of prepared frames, see
+            color.ColorStage for the parameters. The white balance and
+            brightness default to the ones set on the device with
+            self.set_white_balance() and self.set_brightness(), as
+            self.state knows them. white_balance=(100, 100, 100) and
+            brightness=100 with the other defaults turn it off.
+
+        example: self.set_color_correction(gamma=1.8, white_balance=(100, 90, 80), dither="ordered")
+        '''
+        stage = ColorStage(gamma, white_balance, brightness, dither, **kwargs)
+        self._color_stage = None if stage.identity else stage
+
+    def set_sizing(self, mode="letterbox", fill_color=(0, 0, 0), offset=None):
+        '''
+        Description: sets how prepare_frame() makes images square, see
+            sizing.fit_frame() for the parameters.
+
+        :param mode: letterbox, crop, entropy or stretch
+        '''
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode}, use one of {MODES}")
+        self._sizing = (mode, tuple(fill_color), offset)
+
+    def _frame_key(self):
+        '''
+        :return: identifies the settings that change prepared frames, for cache keys
+        '''
+        key = "|".join(map(str, self._sizing))
+        if self._color_stage is not None:
+            key = f"{key}|{self._color_stage.key(self.state)}"
+        return key
+
+    def _frames_key(self, frames):
+        '''
+        :param frames: the keyword arguments for self.send_animation()
+        :return: identifies the animation and the channel it's sent on, None
+            when it isn't compared: idle suppression is off, or the frames are
+            streamed and only known once they were sent
+        '''
+        if not self._skip_unchanged or not isinstance(frames, (list, tuple)):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        for frame in frames:
+            digest.update(f"{frame['pic_num']},{frame['pic_width']},{frame['pic_offset']},"
+                          f"{frame['pic_speed']},".encode())
+            digest.update(frame['pic_data'].encode())
+        return digest.digest(), self.state.get('select_index')
+
+    def _sent_key(self, key):
+        '''
+        :param key: from self._frames_key(), taken before sending
+        :return: what self._shown is set to once it was sent, with the
+            channel as it's known after the send
+        '''
+        return (key[0], self.state.get('select_index')), monotonic()
+
+    def _unchanged(self, key, force=False):
+        '''
+        Description: idle suppression, whether sending an animation would
+            change nothing because the panel already shows it. The panel is
+            assumed to be changed by the commands in PANEL_COMMANDS, by a
+            different known channel, and after resend_after seconds.
+
+        :param key: from self._frames_key()
+        :param force: send anyway
+        :return: True when the send is skipped, counted in self.skipped_sends
+        '''
+        if key is None or force or self._shown is None:
+            return False
+        shown, sent_at = self._shown
+        if key != shown:
+            return False
+        if self._resend_after is not None and monotonic() - sent_at >= self._resend_after:
+            return False
+        self.skipped_sends += 1
+        if self._metrics is not None:
+            self._metrics.skip("Draw/SendHttpGif")
+        return True
 
     def _prepare_buffer(self):
         '''
         encodes the buffer
         '''
-        self.buffer_str = str(base64.b64encode(bytearray(self.buffer)).decode())
+        if self._metrics is None:
+            self.buffer_str = encode_buffer(self.buffer)
+            return
+        start = perf_counter()
+        self.buffer_str = encode_buffer(self.buffer)
+        self._metrics.observe("encode", "base64", perf_counter() - start)
+
+    def _image_frame(self, pic_data=None):
+        '''
+        :param pic_data: the encoded image, default is the encoded buffer
+        :return: the keyword arguments for self.send_animation() to show the
+            image as a still, without the pic_id
+        '''
+        return dict(pic_num=1,
+                    pic_width=self._size,
+                    pic_offset=0,
+                    pic_speed=1000,
+                    pic_data=pic_data or self.buffer_str)
+
+    def _gif_frames(self, gif):
+        '''
+        Description: samples the gif and encodes the frames that are kept.
+
+        :param gif: the opened gif
+        :yield: the keyword arguments for self.send_animation(), without the pic_id
+        '''
+        sample = sample_gif(gif, dedupe=self._dedupe_frames)
+        pic_num = len(sample.indices)
+        logger.debug(f"Pic Num {pic_num} at {sample.pic_speed} ms of {getattr(gif, 'n_frames', 1)} frames.")
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+        previous = None
+        for pic_offset, index in enumerate(sample.indices):
+            if debug:
+                logger.debug(f"Frame: {pic_offset} of {pic_num}, gif frame {index}")
+
+            # prepare data to send, frames picked twice are only encoded once
+            if index != previous:
+                gif.seek(index)
+                frame = self.prepare_frame(gif)
+                self.set_buffer_from_frame(frame)
+                self._prepare_buffer()
+                previous = index
+
+            yield dict(pic_num=pic_num,
+                       pic_width=self._size,
+                       pic_offset=pic_offset,
+                       pic_speed=sample.pic_speed,
+                       pic_data=self.buffer_str)
+
+    def _cached_gif_frames(self, source_id, load):
+        '''
+        Description: the encoded frames of a gif, from the animation cache
+            when it's there.
+
+        :param source_id: identifies the gif, a content hash or a url and etag
+        :param load: returns the opened gif, only called when it isn't cached
+        '''
+        source_id = f"{source_id}|{int(self._dedupe_frames)}|{self._frame_key()}"
+        key = self._animation_cache.key(source_id, self._size, self._rotation, self._mirror)
+        frames = self._animation_cache.get(key)
+        if frames is None:
+            with load() as gif:
+                frames = list(self._gif_frames(gif))
+            self._animation_cache.put(key, frames)
+        else:
+            logger.debug(f"Animation cache hit: {source_id}")
+        return frames
+
+    def local_img_to_buffer(self, filename=None):
+        with Image.open(filename) as img:
+            frame = self.prepare_frame(img)
+            self.set_buffer_from_frame(frame)
+
+    def prepare_frame(self, frame):
+        '''
+        Description: sizes a frame for the device, see self.set_sizing(),
+            and applies the color correction, see self.set_color_correction().
+
+        :param frame: an image, or the current frame of a gif
+        '''
+        mode, fill_color, offset = self._sizing
+        frame = fit_frame(frame, self._size, mode, fill_color, offset)
+        if self._color_stage is not None:
+            frame = self._color_stage(frame, self.state)
+        return frame
+
+    def _fit_to_matrix(self, frame, fill_color=(0, 0, 0)):
+        '''
+        Description: fits the given frame to the matrix, by padding the edges and make
+            it square. Adds black bars on the edges by default.
+
+        :param frame: the image frame
+        :param fill_color: the color to fill the screen with, default is black
+        '''
+        return fit_frame(frame, self._size, "letterbox", fill_color)
+
+    def _zoom_to_fit(self, frame, offset=None):
+        '''
+        Description: zoom into the image to fill the entire matrix, offset
+
+        :param frame: the imagee frame
+        :param offset: number of rows to offset from the top, or left of the image,
+            None centers it
+        '''
+        return fit_frame(frame, self._size, "crop", offset=offset)
+
+    def make_square(self, frame, min_size=0, fill_color=(0, 0, 0)):
+        '''
+        Description: pads the frame to a square at its own resolution.
+
+        :param frame: the image frame
+        :param min_size: the smallest side of the result
+        :param fill_color: the color of the padding
+        '''
+        return make_square(frame, min_size, fill_color)
+
+
+class PixooDevice(PixooFrames, PixooAPI):
+    def __init__(self, animation_cache=None, max_download_size=MAX_DOWNLOAD_SIZE,
+                 dedupe_frames=False, image_cache=None, skip_unchanged=True, resend_after=60.0,
+                 **kwargs):
+        '''
+        :param animation_cache: optional cache.AnimationCache, can be shared between devices
+        :param max_download_size: the largest image or gif downloaded, in bytes
+        :param dedupe_frames: drop near duplicate gif frames before unique ones when sampling
+        :param image_cache: optional cache.HTTPCache for downloaded images and gifs,
+            can be shared between devices
+        :param skip_unchanged: don't send an image, or a cached animation, that
+            is already on the panel, see self.skipped_sends
+        :param resend_after: seconds after which an unchanged image is sent
+            anyway, in case another client changed the panel, None never
+        '''
+        super().__init__(**kwargs)
+        self._animation_cache = animation_cache
+        self._image_cache = image_cache
+        self._max_download_size = max_download_size
+        self._dedupe_frames = dedupe_frames
+        self._skip_unchanged = skip_unchanged
+        self._resend_after = resend_after
+        self.skipped_sends = 0
+
+    def screen_switch_on(self):
+        '''
+        turns off the screen
+        '''
+        self.screen_switch(on_off=1)
+
+    def screen_switch_off(self):
+        '''
+        turns on the screen
+        '''
+        self.screen_switch(on_off=0)
+
+    def sync_orientation(self):
+        '''
+        Description: uses the rotation and mirror settings of the device as
+            the software orientation, from self.state while it's fresh.
+        '''
+        settings = self.get_all_setting()
+        self.set_orientation(rotation=settings.gyrate_angle or 0,
+                             mirror=settings.mirror_flag or 0)
 
     def send_url_gif(self, url):
         '''
@@ -585,10 +1096,93 @@ class PixooDevice(PixooAPI):
         '''
         self._send_url_gif(url)
 
+    def _download(self, response):
+        '''
+        :param response: a response requested with stream=True
+        :return: the body as a temporary file, bounded by max_download_size
+        '''
+        return read_body(response, max_bytes=self._max_download_size)
+
+    def _cached_url(self, url, kind, make):
+        '''
+        Description: the data made from a url, through the image cache. The
+            url is asked for with a conditional request, and when it didn't
+            change the data made last time is used as is. Only 200 answers
+            are cached, an error raises requests.HTTPError.
+
+        :param url: the image or gif
+        :param kind: what make() makes, part of the cache variant
+        :param make: makes bytes from the body
+        :return: the bytes
+        '''
+        cache = self._image_cache
+        variant = f"{kind}-{self._size}-{self._rotation}-{self._mirror}-{int(self._dedupe_frames)}"
+        variant = f"{variant}-{content_hash(self._frame_key().encode())}"
+        headers = {'User-Agent': 'null', **cache.validators(url)}
+        response = self._transport.get(url, headers=headers, stream=True)
+
+        if response.status_code == 304:
+            response.close()
+            data = cache.variant(url, variant)
+            if data is not None:
+                logger.debug(f"Image cache hit: {url}")
+                return data
+            body = cache.body(url)
+            if body is None:
+                # evicted since, ask again without the validators
+                response = self._transport.get(url, headers={'User-Agent': 'null'}, stream=True)
+        else:
+            body = None
+
+        if body is None:
+            response.raise_for_status()
+            body = self._download(response)
+            if response.status_code != 200:
+                logger.warning(f"Not caching {url}, response code: {response.status_code}")
+                with body:
+                    return make(body)
+            cache.put(url, response.headers, body)
+        with body:
+            data = make(body)
+        cache.put_variant(url, variant, data)
+        return data
+
     def _send_url_gif(self, url=None):
-        response = requests.get(url, headers={'User-Agent': 'null'}, stream=True)
-        with Image.open(BytesIO(response.content)) as gif:
-            self._send_gif(gif)
+        if self._image_cache is not None:
+            def make(body):
+                with Image.open(body) as gif:
+                    return json.dumps(list(self._gif_frames(gif))).encode()
+            self.send_frames(json.loads(self._cached_url(url, "gif", make)))
+            return
+
+        response = self._transport.get(url, headers={'User-Agent': 'null'}, stream=True)
+        if self._animation_cache is None:
+            with self._download(response) as body, Image.open(body) as gif:
+                self._send_gif(gif)
+            return
+
+        etag = response.headers.get('ETag')
+        if etag:
+            # the body is only read if the animation isn't cached
+            source_id = f"{url}|{etag}"
+            body = None
+        else:
+            body = self._download(response)
+            source_id = content_hash(body)
+
+        def load():
+            nonlocal body
+            if body is None:
+                body = self._download(response)
+            return Image.open(body)
+
+        try:
+            frames = self._cached_gif_frames(source_id, load)
+        finally:
+            response.close()
+            if body is not None:
+                body.close()
+        self.send_frames(frames)
 
     def send_local_gif(self, filename):
         self._send_local_gif(filename=filename)
@@ -598,149 +1192,108 @@ class PixooDevice(PixooAPI):
         this iterates over the frames of a gif and sends them to the device.
         there's some weird stuff going on with the first frames, so we skip them
         '''
-        with Image.open(filename) as gif:
-            self._send_gif(gif)
+        if self._animation_cache is None:
+            with Image.open(filename) as gif:
+                self._send_gif(gif)
+            return
+
+        with open(filename, 'rb') as f:
+            frames = self._cached_gif_frames(content_hash(f), lambda: Image.open(f))
+        self.send_frames(frames)
 
     def _send_gif(self, gif=None):
         '''
-        This sends the gif, sampling if needed
+        This sends the gif, sampling if needed. The next frames are encoded
+        while the current one is being sent.
         '''
-        pic_speeds = []
-        pic_offset = 0
-        total_frames = gif.n_frames
-        pic_num, frame_offset = self._sample_gif(gif)
+        if not self._pipeline_depth:
+            self.send_frames(self._gif_frames(gif))
+            return
+        frames = Prefetcher(self._gif_frames(gif), depth=self._pipeline_depth)
+        self.send_frames(frames)
+        logger.debug("Gif upload: " + ", ".join(f"{stage} {seconds:.3f}s"
+                                                 for stage, seconds in frames.stats.items()))
 
-        logger.info(f"{total_frames / frame_offset}")
-        self.get_sending_animation_pic_id()
-        try:
-            while True:
-                logger.debug(f"Frame: {pic_offset} of {pic_num}")
-                logger.debug(f"Frame offset: {frame_offset}")
-
-                # append pic speeds, use most common
-                pic_speeds.append(gif.info['duration'])
-                try:
-                    pic_speed = mode(pic_speeds)
-                except:
-                    pic_speed = pic_speeds[0]
-                logger.debug(f"Pic Speed: {pic_speed}")
-
-                # prepare data to send
-                frame = self.prepare_frame(gif)
-                self.set_buffer_from_frame(frame)
-                self._prepare_buffer()
+    def send_frames(self, frames, force=False):
+        '''
+        Description: sends already encoded frames as one animation, unless
+            it's a list of frames already on the panel.
+
+        :param frames: the keyword arguments for self.send_animation(), without the pic_id
+        :param force: send even if the panel already shows them
+        '''
+        key = self._frames_key(frames)
+        if self._unchanged(key, force):
+            logger.debug("Skipped sending an unchanged animation")
+            return
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return
 
-                self.send_animation(pic_num=pic_num,
-                                    pic_width=self._size,
-                                    pic_offset=pic_offset,
-                                    pic_id= self.attr_pic_id,
-                                    pic_speed=pic_speed * frame_offset,
-                                    pic_data=self.buffer_str)
-                
-                # increment pic offset for the next frame
-                pic_offset += 1
-
-                # set gif to next frame
-                gif.seek(gif.tell() + frame_offset)
-        except EOFError:
-            pass
-
-    def _sample_gif(self, gif):
-        for denom in range(1, gif.n_frames):
-            if gif.n_frames / denom < 60:
-                frame_offset = denom
-                pic_num = int(gif.n_frames / frame_offset) + (gif.n_frames % frame_offset > 0)
-                logger.debug(f"Pic Num {pic_num} with offset {frame_offset}.")
-                return (pic_num, frame_offset)
-
-    def send_image(self):
+        self._shown = None
+        with self._pic_id_lock:
+            pic_id = self._next_pic_id()
+            if self.send_animation(pic_id=pic_id, **first).error_code != 0:
+                # the local PicID drifted, ask the device and try again
+                if self._metrics is not None:
+                    self._metrics.retry("Draw/SendHttpGif")
+                self._pic_id = None
+                pic_id = self._next_pic_id()
+                self.send_animation(pic_id=pic_id, **first)
+        for frame in frames:
+            self.send_animation(pic_id=pic_id, **frame)
+        if key is not None:
+            self._shown = self._sent_key(key)
+
+    def send_image(self, force=False):
         '''
         This uploads the image in the buffer to the Pixoo 64
+
+        :param force: send even if the panel already shows it
         '''
         if not self.buffer:
             print(f"The buffer is empty.")
             return
-        self._send_image()
+        self._send_image(force)
 
-    def _send_image(self):
+    def _send_image(self, force=False):
         self._prepare_buffer()
-        self.get_sending_animation_pic_id()
-        self.send_animation(pic_num=1,
-                            pic_width=self._size,
-                            pic_offset=0,
-                            pic_id=self.attr_pic_id,
-                            pic_speed=1000,
-                            pic_data=self.buffer_str)
-
-    def send_url_image(self, img_url):
+        self.send_frames([self._image_frame()], force)
+
+    def send_url_image(self, img_url, force=False):
         self.url_img_to_buffer(img_url)
-        self.send_image()
+        self.send_image(force)
 
     def url_img_to_buffer(self, img_url):
-        response = requests.get(img_url, headers={'User-Agent': 'null'}, stream=True)
-        with Image.open(BytesIO(response.content)) as img:
-            frame = self.prepare_frame(img)
-            self.set_buffer_from_frame(frame)
-
-    def send_local_image(self, filename):
-        self.local_img_to_buffer(filename=filename)
-        self.send_image()
+        if self._image_cache is not None:
+            def make(body):
+                with Image.open(body) as img:
+                    return self.frame_to_buffer(self.prepare_frame(img))
+            self.set_buffer(self._cached_url(img_url, "image", make))
+            return
 
-    def local_img_to_buffer(self, filename=None):
-        with Image.open(filename) as img:
+        response = self._transport.get(img_url, headers={'User-Agent': 'null'}, stream=True)
+        with self._download(response) as body, Image.open(body) as img:
             frame = self.prepare_frame(img)
             self.set_buffer_from_frame(frame)
 
-    def prepare_frame(self, frame):
-        if True:  # make it square
-            x, y = frame.size
-            size = max(x, y)
-            square = Image.new("RGB", (size, size), (0, 0, 0))
-            square.paste(frame, (int((size - x) / 2), int((size - y) / 2)))
-            frame = square.resize((self._size, self._size), Image.Resampling.BILINEAR)
-        else:
-            frame = frame.resize((self._size, self._size), Image.Resampling.BILINEAR)
-
-        frame = frame.rotate(270)
-        frame = ImageOps.mirror(frame)
-        return frame
-
-    def _fit_to_matrix(self, frame, fill_color=(0, 0, 0):
-        '''
-        Description: fits the given frame to the matrix, by padding the edges and make
-            it square. Adds black bars on the edges by default.
-
-        :param frame: the image frame
-        :param fill_color: the color to fill the screen with, default is black
-        '''
-        x, y = frame.size
-        size = max(x, y)
-        square = Image.new("RGB", (size, size), fill_color)
-        square.paste(frame, (int((size - x) / 2), int((size - y) / 2))
-        frame = square.resize((self._size, self._size), Image.Resampling.BILINEAR)
-
-        frame = frame.rotate(270)
-        frame = ImageOps.mirror(frame)
-        return frame
+    def send_local_image(self, filename, force=False):
+        self.local_img_to_buffer(filename=filename)
+        self.send_image(force)
 
-    def _zoom_to_fit(self, frame, offset=None):
+    def send_canvas(self, canvas, force=False):
         '''
-        Description: zoom into the image to fill the entire matrix, offset
-
-        :param frame: the imagee frame
-        :param offset: number of rows to offset from the top, or left of the image
+        :param canvas: a canvas.Canvas, for example from Compositor.render()
+        :param force: send even if the panel already shows it
         '''
-        x, y = frame.size
-        frame = frame.crop()
-        
-
-    def make_square(self, min_size):
-        pass
+        self.set_buffer_from_canvas(canvas)
+        self._send_image(force)
 
 
 class Pixoo64(PixooDevice):
-    def __init__(self, ip):
-        super().__init__(ip=ip, size=64)
+    def __init__(self, ip, **kwargs):
+        super().__init__(ip=ip, size=64, **kwargs)
 
 
 if __name__ == "__main__":
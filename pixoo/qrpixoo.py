@@ -1,13 +1,245 @@
+import os
 import qrcode
 import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from functools import lru_cache, partial
 from typing import Union
 
+import numpy as np
+from PIL import Image, ImageColor
+
+from encoder import encode_buffer
+from sampler import MAX_FRAMES
+
+# below this many codes a process pool costs more to start than it saves
+PARALLEL_THRESHOLD = 8
+
+
+@lru_cache(maxsize=32)
+def qr_matrix(data):
+    '''
+    Description: the modules of the smallest QR code that holds the data,
+        without the quiet zone.
+
+    :param data: the payload
+    :return: a square numpy bool array, True for the dark modules
+    '''
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=1,
+        border=0,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def _rgb(color):
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color)[:3]
+
+
+@lru_cache(maxsize=32)
+def _render(data, fill_color, back_color, size, border):
+    matrix = qr_matrix(data)
+    modules = len(matrix)
+    if modules > size:
+        raise ValueError(f"the QR code is {modules} modules, it doesn't fit in {size} pixels")
+
+    # the biggest whole scale with the quiet zone, without it when it doesn't fit
+    scale = max(size // (modules + 2 * border), 1)
+    scaled = matrix.repeat(scale, axis=0).repeat(scale, axis=1)
+    offset = (size - len(scaled)) // 2
+    canvas = np.zeros((size, size), dtype=np.uint8)
+    canvas[offset:offset + len(scaled), offset:offset + len(scaled)] = scaled
+
+    colors = np.array([back_color, fill_color], dtype=np.uint8)
+    return colors[canvas].tobytes()
+
+
+def render_qr(data, fill_color="black", back_color="white", size=64, border=2):
+    '''
+    Description: rasterizes a QR code for the panel. The modules are scaled
+        by the biggest whole number that fits and centered. The last few
+        codes are cached, keyed by the payload, the colors and the size.
+
+    :param data: the payload
+    :param fill_color: the color of the dark modules, a name, "#RRGGBB" or a tuple
+    :param back_color: the background color
+    :param size: the width and height of the panel
+    :param border: the quiet zone kept around the code, in modules, when it fits
+    :return: the RGB bytes, left to right and top to bottom
+    '''
+    return _render(data, _rgb(fill_color), _rgb(back_color), size, border)
+
+
+def _escape(value):
+    '''
+    the special characters of the WIFI: and MECARD: formats
+    '''
+    return re.sub(r'([\\;,:"])', r'\\\1', str(value))
+
+
+def email_payload(address, cc=None, bcc=None, subject=None, body=None):
+    '''
+    probably add some email validation at some point
+    '''
+    def concat(items):
+        if isinstance(items, list):
+            items = ','.join(items)
+        return items
+
+    def format_str(string):
+        string = string.split(" ")
+        return "%20".join(string)
+
+    temp_data = f"mailto:{address}"
+
+    if cc:
+        cc = concat(cc)
+        temp_data = f"{temp_data}?cc={cc}"
+
+    if bcc:
+        bcc = concat(bcc)
+        temp_data = f"{temp_data}?bcc={bcc}"
+
+    if subject:
+        subject = format_str(subject)
+        temp_data = f"{temp_data}&subject={subject}"
+
+    if body:
+        body = format_str(body)
+        temp_data = f"{temp_data}&body={body}"
+
+    return temp_data
+
+
+def phone_payload(number, country_code=1):
+    number = re.sub('[^0-9]', '', number)
+    return f"tel:+{country_code}{number}"
+
+
+def maps_payload(latitude, longitude, altitude=100):
+    return f"geo:{latitude},{longitude},{altitude}"
+
+
+def wifi_payload(T=None, S="", P=None, H=False, E=None, A=None, I=None, PH2=None):
+    '''
+    see QRCode.add_wifi() for the parameters
+    '''
+    fields = []
+    if T and T != "nopass":
+        fields.append(f"T:{T}")
+    fields.append(f"S:{_escape(S)}")
+    if P is not None and T != "nopass":
+        fields.append(f"P:{_escape(P)}")
+    if H is True:
+        fields.append("H:true")
+    elif H:
+        # phase 2 method, for backwards-compatibility
+        fields.append(f"H:{_escape(H)}")
+    for name, value in (("E", E), ("A", A), ("I", I), ("PH2", PH2)):
+        if value is not None:
+            fields.append(f"{name}:{_escape(value)}")
+    return "WIFI:" + ";".join(fields) + ";;"
+
+
+def mecard_payload(**fields):
+    '''
+    see QRCode.mecard() for the fields, fields that are None are left out
+    '''
+    def field(name, value):
+        if name == "N":
+            # family,given: the comma separates the parts
+            return ",".join(_escape(part) for part in str(value).split(","))
+        return _escape(value)
+
+    fields = [f"{name.replace('_', '-')}:{field(name, value)}"
+              for name, value in fields.items() if value is not None]
+    return "MECARD:" + ";".join(fields) + ";;"
+
+
+def vcard_payload(name, phone=None, email=None, org=None, title=None, url=None,
+                  address=None, note=None):
+    '''
+    see QRCode.add_vcard() for the parameters
+    '''
+    def escape(value):
+        return re.sub(r'([\\;,])', r'\\\1', str(value)).replace("\n", "\\n")
+
+    lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{escape(name)}"]
+    # the structured name, family and given names when there are two
+    parts = str(name).rsplit(" ", 1)
+    family, given = (parts[1], parts[0]) if len(parts) == 2 else (parts[0], "")
+    lines.append(f"N:{escape(family)};{escape(given)};;;")
+    for key, value in (("TEL", phone), ("EMAIL", email), ("ORG", org), ("TITLE", title),
+                       ("URL", url), ("ADR", address), ("NOTE", note)):
+        if value is None:
+            continue
+        if key == "ADR":
+            # the address goes in the street field
+            lines.append(f"ADR:;;{escape(value)};;;;")
+        elif key == "URL":
+            lines.append(f"URL:{value}")
+        else:
+            lines.append(f"{key}:{escape(value)}")
+    lines.append("END:VCARD")
+    return "\n".join(lines)
+
+
+def sms_payload(number, method="sms", subject=None):
+    '''
+    see QRCode.add_sms() for the parameters
+    '''
+    number = re.sub('[^0-9+]', '', number)
+    if method == "sms":
+        return f"SMSTO:{number}:{subject}" if subject else f"SMSTO:{number}"
+    if method in ("facetime", "facetime-audio"):
+        return f"{method}:{number}"
+    raise ValueError(f"unknown method {method}, use sms, facetime or facetime-audio")
+
+
+def _ical_time(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        return value.strftime("%Y%m%dT%H%M%S")
+    if isinstance(value, date):
+        return value.strftime("%Y%m%d")
+    return str(value)
+
+
+def calendar_payload(summary, start, end, location=None, description=None):
+    '''
+    see QRCode.add_calendar_event() for the parameters
+    '''
+    def escape(value):
+        return re.sub(r'([\\;,])', r'\\\1', str(value)).replace("\n", "\\n")
+
+    lines = ["BEGIN:VEVENT", f"SUMMARY:{escape(summary)}",
+             f"DTSTART:{_ical_time(start)}", f"DTEND:{_ical_time(end)}"]
+    if location is not None:
+        lines.append(f"LOCATION:{escape(location)}")
+    if description is not None:
+        lines.append(f"DESCRIPTION:{escape(description)}")
+    lines.append("END:VEVENT")
+    return "\n".join(lines)
+
+
+def _encode_qr(data, fill_color, back_color, size, border):
+    return encode_buffer(render_qr(data, fill_color, back_color, size, border))
+
 
 class QRCode():
-    def __init__(self, data=None, fill_color="black", back_color="white"):
+    def __init__(self, data=None, fill_color="black", back_color="white", size=64, border=2):
         self.data = data
         self.fill_color = fill_color
         self.back_color = back_color
+        self.size = size
+        self.border = border
 
     def set_fill_color(self, color: Union[str, tuple]):
         self.fill_color = color
@@ -20,29 +252,21 @@ class QRCode():
         self.set_back_color(back_color)
 
     def generate(self):
-        qr = qrcode.QRCode(
-            version=10,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=1,
-            border=3,
-        )
-        qr.add_data(self.data)
-        qr.make(fit=True)
-
-        self.img = qr.make_image(fill_color=self.fill_color, back_color=self.back_color)
+        '''
+        Description: builds the module matrix of self.data, it's cached so
+            this is cheap for a payload seen before.
+        '''
+        self.matrix = qr_matrix(self.data)
 
     def buffer(self):
-        buffer = []
-        for x in range(64):
-            for y in range(64):
-                try:
-                    val = self.img.getpixel((x, y))
-                except:
-                    val = 255
-                buffer.append(val)
-                buffer.append(val)
-                buffer.append(val)
-        return buffer
+        '''
+        :return: the RGB bytes of the code, see render_qr()
+        '''
+        return render_qr(self.data, self.fill_color, self.back_color, self.size, self.border)
+
+    @property
+    def img(self):
+        return Image.frombytes("RGB", (self.size, self.size), self.buffer())
 
     def add_string(self, string):
         self.data = string
@@ -54,88 +278,72 @@ class QRCode():
         '''
         nothing gets checked
         '''
-        self.data = url
-
-        self.generate()
-        return self.buffer()
+        return self.add_string(url)
 
     def add_email(self, address, cc=None, bcc=None, subject=None, body=None):
         '''
         probably add some email validation at some point
         '''
-        temp_data = None
-
-        def concat(items):
-            if isinstance(items, list):
-                items = ','.join(items)
-            return items
-
-        def format_str(string):
-            string = string.split(" ")
-            return "%20".join(string)
-
-        temp_data = f"mailto:{address}"
-
-        if cc:
-            cc = concat(cc)
-            temp_data = f"{temp_data}?cc={cc}"
-
-        if bcc:
-            bcc = concat(bcc)
-            temp_data = f"{temp_data}?bcc={bcc}"
-
-        if subject:
-            subject = format_str(subject)
-            temp_data = f"{temp_data}&subject={subject}"
-
-        if body:
-            body = format_str(body)
-            temp_data = f"{temp_data}&body={body}"
-
-        self.data = temp_data
-
-        self.generate()
-        return self.buffer()
+        return self.add_string(email_payload(address, cc, bcc, subject, body))
 
     def add_phone(self, number, country_code=1):
-        temp_data = f"tel:+{country_code}"
-        number = re.sub('[^0-9]', '', number)
-        temp_data = f"{temp_data}{number}"
-        self.data = temp_data
+        return self.add_string(phone_payload(number, country_code))
 
-        self.generate()
-        return self.buffer()
-
-    def add_vcard(self):
-        prefix = "BEGIN:VCARD"
-        postfix = "END:VCARD"
-        pass
+    def add_vcard(self, name, phone=None, email=None, org=None, title=None, url=None,
+                  address=None, note=None):
+        '''
+        :param name: the full name, for example "Jane Doe"
+        :param phone: the phone number
+        :param email: the email address
+        :param org: the company
+        :param title: the job title
+        :param url: a website
+        :param address: the street address, on one line
+        :param note: a note
+        '''
+        return self.add_string(vcard_payload(name, phone, email, org, title, url, address, note))
 
     def mecard(self, ADR=None, BDAY=None, EMAIL=None, N=None,
                NICKNAME=None, NOTE=None, SOUND=None, TEL=None,
                TEL_AV=None, URL=None):
-        temp_data = "MECARD:"
-        temp_data = f"ADR"
-        return temp_data
+        '''
+        :param ADR: the address
+        :param BDAY: the birthday, YYYYMMDD
+        :param EMAIL: the email address
+        :param N: the name, "family,given"
+        :param NICKNAME: the nickname
+        :param NOTE: a note
+        :param SOUND: the reading of the name
+        :param TEL: the phone number
+        :param TEL_AV: the videophone number
+        :param URL: a website
+        '''
+        return self.add_string(mecard_payload(N=N, SOUND=SOUND, TEL=TEL, TEL_AV=TEL_AV,
+                                              EMAIL=EMAIL, NOTE=NOTE, BDAY=BDAY, ADR=ADR,
+                                              URL=URL, NICKNAME=NICKNAME))
 
-    def add_sms(self, number, method, subject):
+    def add_sms(self, number, method="sms", subject=None):
         '''
         :param number: the phone number
         :param method: sms, facetime or facetime-audio
         :param subject: a prefilled message to send
         '''
-        pass
+        return self.add_string(sms_payload(number, method, subject))
 
     def add_maps(self, latitude, longitude, altitude=100):
-        self.data = f"geo:{latitude},{longitude},{altitude}"
-
-        self.generate()
-        return self.buffer()
+        return self.add_string(maps_payload(latitude, longitude, altitude))
 
-    def add_calendar_event(self, summary, start, end):
-        pass
+    def add_calendar_event(self, summary, start, end, location=None, description=None):
+        '''
+        :param summary: the title of the event
+        :param start: a datetime, a date for all day events, or an iCalendar string
+        :param end: same as start
+        :param location: where it takes place
+        :param description: more about it
+        '''
+        return self.add_string(calendar_payload(summary, start, end, location, description))
 
-    def add_wifi(self, T, S, P, H, E, A, I, PH2):
+    def add_wifi(self, T=None, S="", P=None, H=False, E=None, A=None, I=None, PH2=None):
         '''
         :param T: Authentication type; can be WEP
             or WPA or WPA2-EAP, or nopass for no password.
@@ -156,7 +364,43 @@ class QRCode():
         :param I: (WPA2-EAP only) Identity
         :param PH2: (WPA2-EAP only) Phase 2 method, like MSCHAPV2
         '''
-        pass
+        return self.add_string(wifi_payload(T, S, P, H, E, A, I, PH2))
+
+    def add_batch(self, payloads, dwell=5000, processes=None):
+        '''
+        Description: renders many codes as the frames of one animation, so a
+            rotation of codes is a single upload. Big batches are rendered
+            in a process pool. Build the payloads with the *_payload()
+            functions, or pass plain strings.
+
+        :param payloads: the payloads, one code per frame
+        :param dwell: milliseconds each code is shown
+        :param processes: the pool size, None for one per cpu, 1 to render here
+        :return: the frames, for PixooDevice.send_frames()
+
+        example:
+            frames = QRCode().add_batch([wifi_payload("WPA", "lobby", "secret"),
+                                         "https://example.com"], dwell=8000)
+            pixoo.send_frames(frames)
+        '''
+        payloads = list(payloads)
+        if len(payloads) > MAX_FRAMES:
+            raise ValueError(f"{len(payloads)} codes, an animation holds at most {MAX_FRAMES}")
+
+        encode = partial(_encode_qr, fill_color=_rgb(self.fill_color), back_color=_rgb(self.back_color),
+                         size=self.size, border=self.border)
+        processes = processes or os.cpu_count() or 1
+        if processes > 1 and len(payloads) >= PARALLEL_THRESHOLD:
+            with ProcessPoolExecutor(min(processes, len(payloads))) as pool:
+                pic_data = list(pool.map(encode, payloads))
+        else:
+            pic_data = [encode(payload) for payload in payloads]
+
+        return [{"pic_num": len(payloads),
+                 "pic_width": self.size,
+                 "pic_offset": pic_offset,
+                 "pic_speed": dwell,
+                 "pic_data": data} for pic_offset, data in enumerate(pic_data)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+'''
+The answers of the device and of the divoom server, as typed results.
+
+Each command has a result type, a NamedTuple with its fields in snake case.
+Commands without one get a Response or RemoteResponse, which keep the whole
+answer in data.
+'''
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+_CAMEL = re.compile(r'(?<!^)(?=[A-Z])')
+
+# where snake_case() doesn't give a readable field name
+_RENAMES = {
+    "UTCTime": "utc_time",
+    "Time24Flag": "time_24_flag",
+}
+
+
+@lru_cache(maxsize=None)
+def snake_case(camel):
+    '''
+    :param camel: a key of an answer, for example "SelectIndex"
+    :return: the key in snake case, for example "select_index"
+    '''
+    return _CAMEL.sub('_', camel).lower()
+
+
+@lru_cache(maxsize=None)
+def _field_name(key):
+    return _RENAMES.get(key) or snake_case(key)
+
+
+@lru_cache(maxsize=None)
+def _fields(result_type):
+    return frozenset(result_type._fields)
+
+
+class Response(NamedTuple):
+    error_code: int = 0
+    data: dict = None
+
+
+class RemoteResponse(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    data: dict = None
+
+
+class PicId(NamedTuple):
+    error_code: int = 0
+    pic_id: int = None
+
+
+class SelectIndex(NamedTuple):
+    error_code: int = 0
+    select_index: int = None
+
+
+class ClockInfo(NamedTuple):
+    error_code: int = 0
+    clock_id: int = None
+    brightness: int = None
+
+
+class DeviceTime(NamedTuple):
+    error_code: int = 0
+    utc_time: int = None
+    local_time: str = None
+
+
+class AllSettings(NamedTuple):
+    error_code: int = 0
+    brightness: int = None
+    rotation_flag: int = None
+    clock_time: int = None
+    gallery_time: int = None
+    single_galley_time: int = None
+    power_on_channel_id: int = None
+    gallery_show_time_flag: int = None
+    cur_clock_id: int = None
+    time_24_flag: int = None
+    temperature_mode: int = None
+    gyrate_angle: int = None
+    mirror_flag: int = None
+    light_switch: int = None
+
+
+class WeatherInfo(NamedTuple):
+    error_code: int = 0
+    weather: str = None
+    cur_temp: float = None
+    min_temp: float = None
+    max_temp: float = None
+    pressure: int = None
+    humidity: int = None
+    visibility: int = None
+    wind_speed: float = None
+
+
+class DeviceList(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    device_list: list = ()
+
+
+class DialTypes(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    dial_type_list: list = ()
+
+
+class DialList(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    total_num: int = 0
+    dial_list: list = ()
+
+
+class FontList(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    font_list: list = ()
+
+
+class ImgList(NamedTuple):
+    return_code: int = 0
+    return_message: str = ""
+    img_list: list = ()
+
+
+# the local commands, by "Command"
+RESULT_TYPES = {
+    "Draw/GetHttpGifId": PicId,
+    "Channel/GetIndex": SelectIndex,
+    "Channel/GetClockInfo": ClockInfo,
+    "Channel/GetAllConf": AllSettings,
+    "Device/GetDeviceTime": DeviceTime,
+    "Device/GetWeatherInfo": WeatherInfo,
+}
+
+# the remote commands, by url
+REMOTE_RESULT_TYPES = {
+    "Device/ReturnSameLANDevice": DeviceList,
+    "Channel/GetDialType": DialTypes,
+    "Channel/GetDialList": DialList,
+    "Device/GetTimeDialFontList": FontList,
+    "Device/GetImgUploadList": ImgList,
+    "Device/GetImgLikeList": ImgList,
+}
+
+
+def parse(result_type, response):
+    '''
+    Description: builds a result from an answer, keys the result type doesn't
+        have are dropped.
+
+    :param result_type: one of the NamedTuples above
+    :param response: the decoded json answer
+    '''
+    fields = _fields(result_type)
+    values = {}
+    for key, value in response.items():
+        name = _field_name(key)
+        if name in fields:
+            values[name] = value
+    if "data" in fields:
+        values["data"] = response
+    return result_type(**values)
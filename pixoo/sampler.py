@@ -0,0 +1,186 @@
+import math
+from typing import List, NamedTuple
+
+# the device animates at most 59 frames, "PicNum" must be < 60
+MAX_FRAMES = 59
+
+# browsers play gifs with a delay of 10 ms or less at 100 ms, so do we
+DEFAULT_DURATION = 100
+MIN_DURATION = 20
+
+
+class GifSample(NamedTuple):
+    indices: List[int]
+    pic_speed: int
+
+
+def _skip_sub_blocks(fp):
+    while True:
+        size = fp.read(1)
+        if not size:
+            raise EOFError("truncated gif")
+        if size[0] == 0:
+            return
+        fp.seek(size[0], 1)
+
+
+def _gif_delays(fp):
+    '''
+    Description: reads the delay of every frame from the graphic control
+        extensions of a gif file, skipping the image data, so no frame is
+        decoded.
+
+    :param fp: the gif file, positioned anywhere
+    :return: a list with the delay of every frame in ms, or None for
+        frames without one
+    '''
+    fp.seek(0)
+    header = fp.read(13)
+    if len(header) < 13 or header[:3] != b"GIF":
+        raise SyntaxError("not a gif")
+    if header[10] & 0x80:
+        # the global color table
+        fp.seek(3 << ((header[10] & 7) + 1), 1)
+
+    delays = []
+    delay = None
+    while True:
+        block = fp.read(1)
+        if not block or block == b";":
+            return delays
+        if block == b"!":
+            label = fp.read(1)
+            if label == b"\xf9":
+                extension = fp.read(fp.read(1)[0])
+                delay = int.from_bytes(extension[1:3], "little") * 10
+            _skip_sub_blocks(fp)
+        elif block == b",":
+            descriptor = fp.read(9)
+            if len(descriptor) < 9:
+                raise EOFError("truncated gif")
+            if descriptor[8] & 0x80:
+                # the local color table
+                fp.seek(3 << ((descriptor[8] & 7) + 1), 1)
+            fp.seek(1, 1)  # the LZW code size
+            _skip_sub_blocks(fp)
+            delays.append(delay)
+            delay = None
+        else:
+            raise SyntaxError(f"unknown gif block {block!r}")
+
+
+def frame_durations(gif):
+    '''
+    Description: reads the duration of every frame of a gif. For a gif file
+        the delays are read without decoding any frame, anything else is
+        seeked through once.
+
+    :param gif: the opened gif, it's left on the first frame
+    :return: a list of durations in ms
+    '''
+    fp = getattr(gif, "fp", None)
+    delays = None
+    if gif.format == "GIF" and fp is not None:
+        position = fp.tell()
+        try:
+            delays = _gif_delays(fp)
+        except (SyntaxError, EOFError, OSError):
+            delays = None
+        finally:
+            fp.seek(position)
+    if not delays:
+        delays = []
+        for index in range(getattr(gif, 'n_frames', 1)):
+            gif.seek(index)
+            delays.append(gif.info.get('duration'))
+        gif.seek(0)
+
+    durations = []
+    for duration in delays:
+        duration = duration or DEFAULT_DURATION
+        durations.append(duration if duration >= MIN_DURATION else DEFAULT_DURATION)
+    return durations
+
+
+def frame_hash(frame, size=8):
+    '''
+    Description: a cheap perceptual hash, frames with the same hash are
+        near duplicates. Each bit says if a pixel of the frame, shrunk to
+        size x size grey pixels, is brighter than the average.
+    '''
+    small = frame.convert("L").resize((size, size))
+    pixels = small.tobytes()
+    average = sum(pixels) / len(pixels)
+    return bytes(pixel > average for pixel in pixels)
+
+
+def merge_duplicates(gif, durations):
+    '''
+    Description: merges runs of near duplicate frames into their first frame.
+        Every frame is decoded to be compared.
+
+    :param gif: the opened gif, it's left on the first frame
+    :param durations: the duration of every frame
+    :return: a list of (frame index, duration) segments
+    '''
+    segments = []
+    previous = None
+    for index, duration in enumerate(durations):
+        gif.seek(index)
+        current = frame_hash(gif)
+        if segments and current == previous:
+            first, total = segments[-1]
+            segments[-1] = (first, total + duration)
+        else:
+            segments.append((index, duration))
+        previous = current
+    gif.seek(0)
+    return segments
+
+
+def sample_durations(segments, max_frames=MAX_FRAMES):
+    '''
+    Description: picks the frames to show at a single, constant speed so the
+        animation keeps its wall-clock length. Frames are sampled on an even
+        time grid as fine as the shortest segment, capped at max_frames.
+        Long segments can be picked more than once.
+
+    :param segments: a list of (frame index, duration) in ms
+    :param max_frames: the most frames to pick
+    :return: a GifSample
+    '''
+    total = sum(duration for _, duration in segments)
+    shortest = min(duration for _, duration in segments)
+    pic_num = max(1, min(max_frames, round(total / shortest)))
+    step = total / pic_num
+
+    indices = []
+    segment = 0
+    segment_end = segments[0][1]
+    for frame in range(pic_num):
+        # sample the middle of every step of the grid
+        t = (frame + 0.5) * step
+        while t >= segment_end and segment < len(segments) - 1:
+            segment += 1
+            segment_end += segments[segment][1]
+        indices.append(segments[segment][0])
+    return GifSample(indices, max(1, math.floor(step + 0.5)))
+
+
+def sample_gif(gif, max_frames=MAX_FRAMES, dedupe=False):
+    '''
+    Description: picks the frames of a gif to send, and the speed to play
+        them at, keeping the animation's wall-clock length.
+
+    :param gif: the opened gif
+    :param max_frames: the most frames to pick
+    :param dedupe: merge near duplicate frames first, so they are dropped
+        before any unique frame is
+    :return: a GifSample
+    '''
+    durations = frame_durations(gif)
+    if dedupe:
+        segments = merge_duplicates(gif, durations)
+    else:
+        segments = list(enumerate(durations))
+    return sample_durations(segments, max_frames=max_frames)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from setup_logger import logger
+
+
+class SendScheduler:
+    '''
+    Description: sends images to a device from a background thread, at most
+        one every min_interval seconds. Only the latest submitted image is
+        kept, so a producer faster than the device drops stale frames instead
+        of queueing them, and dropped frames are never encoded. The PicID is
+        reset by the device before the firmware's refresh limit is reached.
+
+    :param device: the PixooDevice to send to
+    :param min_interval: the least seconds between the start of two sends
+    '''
+    def __init__(self, device, min_interval=0.1):
+        self.device = device
+        self.min_interval = min_interval
+
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self._pending = None
+        self._sending = False
+        self._closed = False
+        self._last_send = 0.0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"pixoo-{device._ip}", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, img):
+        '''
+        Description: queues an image, replacing one that wasn't sent yet.
+
+        :param img: a PIL image
+        '''
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("the scheduler is closed")
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = img
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        '''
+        Description: waits until the latest image was sent.
+
+        :return: False if it timed out
+        '''
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending is None and not self._sending, timeout)
+
+    def close(self):
+        '''
+        Description: sends the latest image, if any, and stops the thread.
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _next(self):
+        '''
+        :return: the image to send next, or None once closed
+        '''
+        with self._condition:
+            while True:
+                if self._pending is None:
+                    if self._closed:
+                        return None
+                    self._condition.wait()
+                    continue
+                delay = self._last_send + self.min_interval - time.monotonic()
+                if delay > 0:
+                    # newer images may arrive while we wait
+                    self._condition.wait(delay)
+                    continue
+                img, self._pending = self._pending, None
+                self._sending = True
+                self._last_send = time.monotonic()
+                return img
+
+    def _run(self):
+        while True:
+            img = self._next()
+            if img is None:
+                return
+            try:
+                frame = self.device.prepare_frame(img)
+                self.device.set_buffer_from_frame(frame)
+                self.device.send_image()
+                self.sent += 1
+            except Exception as e:
+                logger.error(f"{self.device._ip}: {e}")
+                self.errors += 1
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
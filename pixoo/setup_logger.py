@@ -1,4 +1,15 @@
 import logging
+import os
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger('pixoo')
\ No newline at end of file
+# the level comes from the environment, for example: PIXOO_LOG_LEVEL=DEBUG python pixoo64.py
+LOG_LEVEL = os.environ.get("PIXOO_LOG_LEVEL", "INFO").upper()
+
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger('pixoo')
+
+
+def set_log_level(level):
+    '''
+    :param level: a logging level, like logging.DEBUG or "DEBUG"
+    '''
+    logging.getLogger().setLevel(level)
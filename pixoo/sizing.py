@@ -0,0 +1,142 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+MODES = ("letterbox", "crop", "entropy", "stretch")
+
+# the resize after draft() and reduce() starts from at least this many times the target
+_QUALITY_MARGIN = 2
+
+
+def _decode_small(img, width, height):
+    '''
+    Description: decodes no more than needed for a width x height result:
+        JPEGs are decoded at a reduced scale with draft(), anything else is
+        shrunk by a whole factor with reduce() first.
+    '''
+    if img.format == "JPEG" and getattr(img, "tile", None):
+        # only before the image is loaded
+        img.draft("RGB", (width * _QUALITY_MARGIN, height * _QUALITY_MARGIN))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    factor = min(img.size[0] // (width * _QUALITY_MARGIN), img.size[1] // (height * _QUALITY_MARGIN))
+    if factor > 1:
+        img = img.reduce(factor)
+    return img
+
+
+def _entropy(gray):
+    counts = np.bincount(gray.ravel(), minlength=256)
+    p = counts[counts > 0] / gray.size
+    return -(p * np.log2(p)).sum()
+
+
+def entropy_offset(img, positions=16):
+    '''
+    Description: where the square crop of an image holds the most detail,
+        measured as the entropy of the histogram of the crop.
+
+    :param img: an RGB image
+    :param positions: the crop positions compared along the long side
+    :return: the offset of the best crop from the top or left, in pixels of img
+    '''
+    width, height = img.size
+    scale = min(1.0, 96 / min(width, height))
+    small = np.asarray(img.convert("L").resize((max(1, round(width * scale)),
+                                                max(1, round(height * scale)))))
+    side = min(small.shape)
+    room = max(small.shape) - side
+    if room <= 0:
+        return 0
+
+    best, best_score = 0, -1.0
+    for offset in np.linspace(0, room, min(positions, room + 1)).round().astype(int):
+        window = small[offset:offset + side] if small.shape[0] > small.shape[1] else small[:, offset:offset + side]
+        score = _entropy(window)
+        if score > best_score:
+            best, best_score = offset, score
+    return round(best / scale)
+
+
+def crop_box(width, height, offset=None):
+    '''
+    :param offset: pixels from the top or left to the square crop, a float
+        from 0 to 1 for a fraction of the room, None centers it
+    :return: the box of the largest square crop
+    '''
+    side = min(width, height)
+    room = max(width, height) - side
+    if offset is None:
+        offset = room // 2
+    elif isinstance(offset, float):
+        offset = round(room * offset)
+    offset = max(0, min(int(offset), room))
+    if width > height:
+        return (offset, 0, offset + side, side)
+    return (0, offset, side, offset + side)
+
+
+def fit_frame(img, size, mode="letterbox", fill_color=(0, 0, 0), offset=None,
+              resample=Image.Resampling.BILINEAR):
+    '''
+    Description: sizes an image to a square frame for the device, without
+        ever padding or copying it at full size.
+
+    :param img: the PIL image, it's cheapest when it isn't loaded yet
+    :param size: the width and height of the frame
+    :param mode:
+        letterbox: all of the image, with bars of fill_color
+        crop: the largest square, at offset
+        entropy: the largest square with the most detail
+        stretch: all of the image, squeezed square
+    :param fill_color: the color of the letterbox bars
+    :param offset: see crop_box(), for the crop mode
+    :param resample: the resampling filter
+    :return: an RGB image of size x size
+    '''
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode}, use one of {MODES}")
+    width, height = img.size
+
+    if mode == "stretch":
+        return _decode_small(img, size, size).resize((size, size), resample)
+
+    if mode == "letterbox":
+        scale = size / max(width, height)
+        fitted = (max(1, round(width * scale)), max(1, round(height * scale)))
+        img = _decode_small(img, *fitted).resize(fitted, resample)
+        if fitted == (size, size):
+            return img
+        frame = Image.new("RGB", (size, size), fill_color)
+        frame.paste(img, ((size - fitted[0]) // 2, (size - fitted[1]) // 2))
+        return frame
+
+    # the crops, decoded with the short side near the size
+    scale = size / min(width, height)
+    img = _decode_small(img, max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+    if mode == "entropy":
+        offset = entropy_offset(img)
+    elif isinstance(offset, int):
+        # in pixels of the original image
+        offset = round(offset * img.size[0] / width)
+    box = crop_box(*img.size, offset)
+    return img.resize((size, size), resample, box=box)
+
+
+def make_square(img, min_size=0, fill_color=(0, 0, 0)):
+    '''
+    Description: pads an image to a square at its own resolution.
+
+    :param min_size: the smallest side of the result
+    :param fill_color: the color of the padding
+    '''
+    width, height = img.size
+    side = max(width, height, min_size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if (width, height) == (side, side):
+        return img
+    square = Image.new("RGB", (side, side), fill_color)
+    square.paste(img, ((side - width) // 2, (side - height) // 2))
+    return square
@@ -0,0 +1,151 @@
+from time import monotonic
+
+from responses import RESULT_TYPES, Response
+
+# the commands that change what the panel shows: after them an animation is
+# sent again even when it's the one that was last sent, and the channel is
+# read from the device again. They are never answered from the state.
+PANEL_COMMANDS = frozenset({
+    "Channel/SetClockSelectId", "Channel/SetIndex", "Channel/SetCustomPageIndex",
+    "Channel/SetEqPosition", "Channel/CloudIndex", "Device/PlayTFGif",
+    "Draw/SendHttpText", "Draw/ClearHttpText", "Draw/SendHttpItemList", "Draw/CommandList",
+    "Tools/SetTimer", "Tools/SetStopWatch", "Tools/SetScoreBoard", "Tools/SetNoiseStatus",
+})
+
+# the queries answered from the state while they're fresh
+QUERIES = ("Channel/GetAllConf", "Channel/GetIndex", "Channel/GetClockInfo")
+
+# the fields each setter changes: (request key, field) pairs, and the fields
+# it implies, like the channel a select command moves to
+SETTERS = {
+    "Channel/SetBrightness": ((("Brightness", "brightness"),), {}),
+    "Channel/SetIndex": ((("SelectIndex", "select_index"),), {}),
+    "Channel/SetClockSelectId": ((("ClockId", "clock_id"), ("ClockId", "cur_clock_id")),
+                                 {"select_index": 0}),
+    "Channel/CloudIndex": ((("Index", "cloud_index"),), {"select_index": 1}),
+    "Channel/SetEqPosition": ((("EqPosition", "eq_position"),), {"select_index": 2}),
+    "Channel/SetCustomPageIndex": ((("CustomPageIndex", "custom_page_index"),),
+                                   {"select_index": 3}),
+    "Channel/OnOffScreen": ((("OnOff", "light_switch"),), {}),
+    "Device/SetDisTempMode": ((("Mode", "temperature_mode"),), {}),
+    "Device/SetScreenRotationAngle": ((("Mode", "gyrate_angle"),), {}),
+    "Device/SetMirrorMode": ((("Mode", "mirror_flag"),), {}),
+    "Device/SetTime24Flag": ((("Mode", "time_24_flag"),), {}),
+    "Device/SetHighLightMode": ((("Mode", "high_light_mode"),), {}),
+    "Device/SetWhiteBalance": ((("RValue", "r_value"), ("GValue", "g_value"),
+                                ("BValue", "b_value")), {}),
+}
+
+
+class DeviceState:
+    '''
+    Description: a mirror of the settings of a device, so reading them
+        doesn't cost a post. The setters write their values through once the
+        device took them, the queries in QUERIES are answered from it while
+        their last real answer is younger than max_age, and a setter of a
+        plain setting, like the brightness, that wouldn't change a value
+        known for less than max_age isn't sent. Commands that change the
+        panel are always sent, and after them, or an animation, the channel
+        is unknown until it's read again.
+
+        skipped counts the posts saved.
+
+    :param max_age: seconds a value is trusted, other clients can change the
+        device meanwhile; 0 turns the mirror off, None trusts it forever
+    '''
+    def __init__(self, max_age=30.0):
+        self.max_age = max_age
+        self.skipped = 0
+        # field: (value, monotonic() when it was read or set)
+        self._values = {}
+        # query: monotonic() of its last real answer
+        self._answered = {}
+
+    def _fresh(self, at):
+        if self.max_age is None:
+            return True
+        return monotonic() - at < self.max_age
+
+    def get(self, field, default=None):
+        '''
+        :param field: a field of the results, for example "brightness"
+        :return: the value, fresh or not, or default if it was never seen
+        '''
+        value = self._values.get(field)
+        return default if value is None else value[0]
+
+    def invalidate(self, *fields):
+        '''
+        Description: forgets the values, all of them without fields, so they
+            are read from the device again.
+        '''
+        if not fields:
+            self._values.clear()
+            self._answered.clear()
+            return
+        for field in fields:
+            self._values.pop(field, None)
+        self._answered.clear()
+
+    def cached(self, data):
+        '''
+        :param data: a local command
+        :return: the result for it without posting: a fresh query answer, or
+            the answer to a setter that changes nothing; None to post it
+        '''
+        if self.max_age == 0:
+            return None
+        command = data.get("Command")
+        if command in QUERIES:
+            at = self._answered.get(command)
+            if at is None or not self._fresh(at):
+                return None
+            result_type = RESULT_TYPES[command]
+            result = result_type(**{field: self.get(field) for field in result_type._fields[1:]})
+        elif command in SETTERS and command not in PANEL_COMMANDS:
+            if not all(self._unchanged(field, value) for field, value in self._writes(data)):
+                return None
+            result = Response()
+        else:
+            return None
+        self.skipped += 1
+        return result
+
+    def _unchanged(self, field, value):
+        known = self._values.get(field)
+        return known is not None and known[0] == value and self._fresh(known[1])
+
+    @staticmethod
+    def _writes(data):
+        keys, implied = SETTERS[data["Command"]]
+        for key, field in keys:
+            yield field, data.get(key)
+        yield from implied.items()
+
+    def update(self, data, result):
+        '''
+        Description: keeps what a successful answer tells about the device.
+
+        :param data: the local command that was posted
+        :param result: its result from responses.py
+        '''
+        if result.error_code != 0:
+            return
+        command = data.get("Command")
+        now = monotonic()
+        if command in PANEL_COMMANDS or command == "Draw/SendHttpGif":
+            # the panel left the channel it was on, the channel setters set it again below
+            self._values.pop("select_index", None)
+            self._answered.pop("Channel/GetIndex", None)
+        if command in QUERIES:
+            self._answered[command] = now
+            for field, value in result._asdict().items():
+                if value is not None and field != "error_code":
+                    self._values[field] = (value, now)
+        elif command in SETTERS:
+            for field, value in self._writes(data):
+                self._values[field] = (value, now)
+        elif command == "Draw/CommandList":
+            for item in data.get("CommandList", ()):
+                if item.get("Command") in SETTERS:
+                    self.update(item, result)
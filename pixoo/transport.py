@@ -0,0 +1,80 @@
+from tempfile import SpooledTemporaryFile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# the default limit for downloaded images and gifs
+MAX_DOWNLOAD_SIZE = 32 * 1024 * 1024
+
+
+def read_body(response, max_bytes=None, chunk_size=64 * 1024, spool_size=1024 * 1024):
+    '''
+    Description: reads a streamed response into a temporary file, without
+        ever holding the whole body in memory. Bodies bigger than spool_size
+        are kept on disk.
+
+    :param response: a response requested with stream=True
+    :param max_bytes: refuse bodies bigger than this, checked against the
+        Content-Length first and then while reading
+    :param chunk_size: the bytes read at a time
+    :param spool_size: the bytes kept in memory before spilling to disk
+    :return: the body, as a binary file positioned at the start
+    '''
+    length = response.headers.get('Content-Length')
+    if max_bytes and length and int(length) > max_bytes:
+        response.close()
+        raise ValueError(f"{response.url} is {length} bytes, the limit is {max_bytes}")
+
+    body = SpooledTemporaryFile(max_size=spool_size)
+    read = 0
+    with response:
+        for chunk in response.iter_content(chunk_size):
+            read += len(chunk)
+            if max_bytes and read > max_bytes:
+                body.close()
+                raise ValueError(f"{response.url} is over the limit of {max_bytes} bytes")
+            body.write(chunk)
+    body.seek(0)
+    return body
+
+
+class HTTPTransport:
+    '''
+    Description: keep-alive HTTP transport, one per device. Connections are
+        pooled by a requests.Session so an animation upload reuses a single
+        TCP connection, and every request has a connect and a read timeout
+        so a hung device can't block forever.
+
+    :param connect_timeout: seconds to wait for the connection
+    :param read_timeout: seconds to wait for the response
+    :param pool_maxsize: connections kept alive per host
+    '''
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_maxsize=1):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def post(self, url, data=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, data=data, **kwargs)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules import each other by name, like the scripts in pixoo/ are run
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "pixoo"))
+os.environ.setdefault("PIXOO_LOG_LEVEL", "WARNING")
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+from asyncpixoo import AsyncPixoo64
+from cache import AnimationCache
+from fakepixoo import FakePixoo64
+
+
+def test_decoding_runs_off_the_event_loop():
+    threads = []
+
+    async def main(fake, **kwargs):
+        async with AsyncPixoo64(fake.ip, **kwargs) as pixoo:
+            pixoo.url = fake.url
+            prepare_frame = pixoo.prepare_frame
+
+            def recording(frame):
+                threads.append(threading.current_thread())
+                return prepare_frame(frame)
+
+            pixoo.prepare_frame = recording
+            await pixoo.send_local_gif("pixoo/meme.gif")
+            await pixoo.send_local_image("pixoo/dsotm1.jpg")
+
+    with FakePixoo64() as fake:
+        asyncio.run(main(fake))
+        asyncio.run(main(fake, animation_cache=AnimationCache()))
+    assert threads
+    assert threading.main_thread() not in threads
+    assert fake.commands["Draw/SendHttpGif"] > 2
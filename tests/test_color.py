@@ -0,0 +1,45 @@
+from PIL import Image
+
+from color import ColorStage, palette_dither
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+
+
+def gradient():
+    return Image.linear_gradient("L").resize((64, 64)).convert("RGB")
+
+
+def test_floyd_steinberg_diffuses_the_error():
+    frame = gradient()
+    palette = frame.quantize(8, method=Image.Quantize.FASTOCTREE)
+    plain = frame.quantize(palette=palette, dither=Image.Dither.NONE).convert("RGB")
+    dithered = palette_dither(frame, 8)
+    assert dithered.tobytes() != plain.tobytes()
+    assert len(dithered.getcolors()) <= 8
+
+
+def test_default_stage_is_off():
+    stage = ColorStage(white_balance=(100, 100, 100), brightness=100)
+    assert stage.identity
+    frame = gradient()
+    assert stage(frame).tobytes() == frame.tobytes()
+
+
+def test_stage_follows_the_device_settings():
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip)
+        pixoo.url = fake.url
+        pixoo.set_color_correction(gamma=1.0)
+        frame = Image.new("RGB", (64, 64), (200, 200, 200))
+        key = pixoo._frame_key()
+        assert pixoo.prepare_frame(frame).getpixel((0, 0)) == (200, 200, 200)
+
+        pixoo.set_brightness(50)
+        pixoo.set_white_balance(100, 50, 100)
+        assert pixoo._frame_key() != key
+        assert pixoo.prepare_frame(frame).getpixel((0, 0)) == (100, 50, 100)
+
+        # explicit values don't follow the device
+        pixoo.set_color_correction(white_balance=(100, 100, 100), brightness=100, gamma=2.0)
+        assert pixoo.prepare_frame(frame).getpixel((0, 0))[0] == round(255 * (200 / 255) ** 2)
+        pixoo.close()
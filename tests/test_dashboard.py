@@ -0,0 +1,27 @@
+from PIL import Image
+
+from dashboard import Dashboard
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+
+
+def test_flush_sends_only_changes():
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip)
+        pixoo.url = fake.url
+        dashboard = Dashboard(pixoo)
+        dashboard.set_background(Image.new("RGB", (64, 64), (0, 0, 255)))
+        dashboard.set_text(0, "12:00", y=24)
+        dashboard.set_item(1, 22, text_string="hi")
+        assert dashboard.flush() > 0
+        assert dashboard.flush() == 0
+
+        dashboard.set_text(0, "12:01", y=24)
+        dashboard.flush()
+        pixoo.close()
+
+    assert fake.commands["Draw/SendHttpGif"] == 1
+    assert fake.commands["Draw/CommandList"] == 2
+    assert fake.commands["Draw/SendHttpText"] == 2
+    assert fake.commands["Draw/SendHttpItemList"] == 1
+    assert (dashboard.full_frames, dashboard.partial_updates) == (1, 2)
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+
+
+@pytest.fixture
+def fake():
+    with FakePixoo64() as fake:
+        yield fake
+
+
+def device(fake, **kwargs):
+    pixoo = Pixoo64(fake.ip, **kwargs)
+    pixoo.url = fake.url
+    return pixoo
+
+
+def test_repeated_setter_is_not_posted(fake):
+    pixoo = device(fake)
+    pixoo.set_brightness(40)
+    pixoo.set_brightness(40)
+    assert fake.commands["Channel/SetBrightness"] == 1
+    assert pixoo.state.skipped == 1
+
+    pixoo.set_brightness(60)
+    assert fake.commands["Channel/SetBrightness"] == 2
+    assert fake.settings["Brightness"] == 60
+
+
+def test_setters_write_through(fake):
+    pixoo = device(fake)
+    pixoo.set_brightness(30)
+    pixoo.set_white_balance(100, 80, 60)
+    assert pixoo.state.get("brightness") == 30
+    assert (pixoo.state.get("r_value"), pixoo.state.get("g_value"), pixoo.state.get("b_value")) \
+        == (100, 80, 60)
+
+
+def test_queries_are_answered_from_the_state(fake):
+    pixoo = device(fake)
+    first = pixoo.get_all_setting()
+    second = pixoo.get_all_setting()
+    assert fake.commands["Channel/GetAllConf"] == 1
+    assert second == first
+
+    # a setter changes the cached answer without asking again
+    pixoo.set_brightness(20)
+    assert pixoo.get_all_setting().brightness == 20
+    assert fake.commands["Channel/GetAllConf"] == 1
+
+    pixoo.refresh_state()
+    assert fake.commands["Channel/GetAllConf"] == 2
+
+
+def test_stale_state_is_read_again(fake):
+    pixoo = device(fake, state_max_age=0.05)
+    pixoo.get_all_setting()
+    pixoo.set_brightness(50)
+    time.sleep(0.1)
+    pixoo.set_brightness(50)
+    pixoo.get_all_setting()
+    assert fake.commands["Channel/GetAllConf"] == 2
+    assert fake.commands["Channel/SetBrightness"] == 2
+
+
+def test_max_age_zero_turns_it_off(fake):
+    pixoo = device(fake, state_max_age=0)
+    pixoo.set_brightness(40)
+    pixoo.set_brightness(40)
+    pixoo.get_all_setting()
+    pixoo.get_all_setting()
+    assert fake.commands["Channel/SetBrightness"] == 2
+    assert fake.commands["Channel/GetAllConf"] == 2
+
+
+def test_select_channel_is_always_posted(fake):
+    pixoo = device(fake)
+    pixoo.select_channel(2)
+    assert pixoo.state.get("select_index") == 2
+    pixoo.select_channel(2)
+    assert fake.commands["Channel/SetIndex"] == 2
+
+    assert pixoo.get_current_channel() == 2
+    assert pixoo.get_current_channel() == 2
+    assert fake.commands["Channel/GetIndex"] == 1
+    # the channel is read again after a panel command
+    pixoo.select_channel(1)
+    assert pixoo.get_current_channel() == 1
+    assert fake.commands["Channel/GetIndex"] == 2
+
+
+def test_gif_forgets_the_channel(fake):
+    pixoo = device(fake)
+    pixoo.get_current_channel()
+    assert pixoo.state.get("select_index") is not None
+
+    pixoo.send_local_gif("pixoo/meme.gif")
+    assert pixoo.state.get("select_index") is None
+    pixoo.get_current_channel()
+    assert fake.commands["Channel/GetIndex"] == 2
+    # the other settings are kept
+    pixoo.get_all_setting()
+    pixoo.get_all_setting()
+    assert fake.commands["Channel/GetAllConf"] == 1
@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from PIL import Image
+
+from fakepixoo import FakePixoo64
+from group import PixooGroup
+from pixoo import Pixoo64
+
+
+def repeating_gif():
+    '''
+    :return: a gif of two colors, four frames each that differ in one pixel,
+        so Pillow keeps them apart but dedupe merges them
+    '''
+    frames = []
+    for index in range(8):
+        frame = Image.new("RGB", (64, 64), (255, 0, 0) if index < 4 else (0, 0, 255))
+        frame.putpixel((index, 0), (index, index, index))
+        frames.append(frame)
+    gif = BytesIO()
+    frames[0].save(gif, "GIF", save_all=True, append_images=frames[1:], duration=100)
+    gif.seek(0)
+    return Image.open(gif)
+
+
+def test_members_with_different_dedupe_get_their_own_frames():
+    with FakePixoo64() as plain, FakePixoo64() as deduped:
+        devices = []
+        for fake, dedupe in ((plain, False), (deduped, True)):
+            device = Pixoo64(fake.ip, dedupe_frames=dedupe)
+            device.url = fake.url
+            devices.append(device)
+
+        with PixooGroup(devices) as group:
+            assert len(group._variants()) == 2
+            with repeating_gif() as gif:
+                assert all(result.ok for result in group.send_gif(gif))
+
+    assert plain.commands["Draw/SendHttpGif"] == 8
+    assert deduped.commands["Draw/SendHttpGif"] < 8
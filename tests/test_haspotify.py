@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from asyncpixoo import AsyncPixoo64
+from fakehomeassistant import FakeHomeAssistant
+from fakepixoo import FakePixoo64
+from haspotify import AlbumArtSync, HASpotify
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.01)
+
+
+def run_sync(scenario, **hass_kwargs):
+    '''
+    Description: runs an AlbumArtSync between a FakeHomeAssistant and a
+        FakePixoo64, and awaits scenario(hass, sync, fake) once it's subscribed.
+    '''
+    async def main(fake):
+        async with FakeHomeAssistant(cover_size=64, **hass_kwargs) as hass:
+            async with AsyncPixoo64(fake.ip) as pixoo:
+                pixoo.url = fake.url
+                haspotify = HASpotify(token=hass.token, interface=hass.url,
+                                      entity_id=hass.entity_id)
+                sync = AlbumArtSync(pixoo, haspotify, reconnect_delay=0.01)
+                task = asyncio.create_task(sync.run())
+                try:
+                    await wait_for(lambda: hass.subscribers)
+                    await scenario(hass, sync, fake)
+                finally:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+
+    with FakePixoo64() as fake:
+        asyncio.run(main(fake))
+    return fake
+
+
+def test_sends_only_when_the_picture_changes():
+    async def scenario(hass, sync, fake):
+        await hass.play("track 1")
+        await wait_for(lambda: sync.stats["sent"] == 1)
+        # paused, same cover
+        await hass.set_state(dict(hass.state, state="paused"))
+        await wait_for(lambda: sync.stats["events"] == 3)
+        await hass.play("track 2")
+        await wait_for(lambda: sync.stats["sent"] == 2)
+        assert sync.stats["errors"] == 0
+
+    fake = run_sync(scenario)
+    assert fake.commands["Draw/SendHttpGif"] == 2
+
+
+def test_repeated_cover_is_not_downloaded_again():
+    async def scenario(hass, sync, fake):
+        await hass.play("track 1")
+        await wait_for(lambda: sync.stats["sent"] == 1)
+        await hass.play("track 1")
+        await wait_for(lambda: sync.stats["skipped"] == 2)
+        assert hass.requests["cover"] == 1
+        assert sync.stats["sent"] == 1
+
+    run_sync(scenario)
+
+
+def test_reconnects_after_a_restart():
+    async def scenario(hass, sync, fake):
+        await hass.play("track 1")
+        await wait_for(lambda: sync.stats["sent"] == 1)
+        hass.drop_handshakes = 1
+        await hass.disconnect()
+        await wait_for(lambda: hass.requests["websocket"] == 3 and hass.subscribers)
+        await hass.play("track 2")
+        await wait_for(lambda: sync.stats["sent"] == 2)
+        # the state is read again on every connection, the cover didn't change meanwhile
+        assert hass.requests["cover"] == 2
+
+    run_sync(scenario)
+
+
+def test_superseded_cover_is_dropped():
+    async def scenario(hass, sync, fake):
+        await hass.play("track 1")
+        await hass.play("track 2")
+        await wait_for(lambda: sync.stats["sent"] == 1)
+        await asyncio.sleep(0.3)
+        assert sync.stats["sent"] == 1
+        assert sync._wanted == hass.state["attributes"]["entity_picture"]
+
+    fake = run_sync(scenario, cover_latency=0.1)
+    assert fake.commands["Draw/SendHttpGif"] == 1
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from PIL import Image
+
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+
+
+@pytest.fixture
+def fake():
+    with FakePixoo64() as fake:
+        yield fake
+
+
+def device(fake, **kwargs):
+    pixoo = Pixoo64(fake.ip, **kwargs)
+    pixoo.url = fake.url
+    return pixoo
+
+
+def show(pixoo, color=(255, 0, 0), **kwargs):
+    pixoo.set_buffer_from_frame(Image.new("RGB", (64, 64), color))
+    pixoo.send_image(**kwargs)
+
+
+def test_identical_frame_is_skipped(fake):
+    pixoo = device(fake)
+    show(pixoo)
+    show(pixoo)
+    assert fake.commands["Draw/SendHttpGif"] == 1
+    assert pixoo.skipped_sends == 1
+
+    show(pixoo, (0, 255, 0))
+    assert fake.commands["Draw/SendHttpGif"] == 2
+
+
+def test_force_sends_anyway(fake):
+    pixoo = device(fake)
+    show(pixoo)
+    show(pixoo, force=True)
+    assert fake.commands["Draw/SendHttpGif"] == 2
+    assert pixoo.skipped_sends == 0
+
+
+def test_resent_after_resend_after(fake):
+    pixoo = device(fake, resend_after=0.05)
+    show(pixoo)
+    show(pixoo)
+    assert fake.commands["Draw/SendHttpGif"] == 1
+    time.sleep(0.1)
+    show(pixoo)
+    assert fake.commands["Draw/SendHttpGif"] == 2
+
+
+def test_channel_change_sends_again(fake):
+    pixoo = device(fake)
+    show(pixoo)
+    pixoo.select_channel(1)
+    show(pixoo)
+    assert fake.commands["Draw/SendHttpGif"] == 2
+
+
+def test_skipping_can_be_turned_off(fake):
+    pixoo = device(fake, skip_unchanged=False)
+    show(pixoo)
+    show(pixoo)
+    assert fake.commands["Draw/SendHttpGif"] == 2
@@ -0,0 +1,81 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+import requests
+from PIL import Image
+
+from cache import HTTPCache
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+
+
+def jpeg(color):
+    body = BytesIO()
+    Image.new("RGB", (64, 64), color).save(body, "JPEG")
+    return body.getvalue()
+
+
+class CoverHandler(BaseHTTPRequestHandler):
+    '''
+    Description: serves a cover with an ETag, or an error page that has one
+        too while status isn't 200.
+    '''
+    status = 200
+    body = jpeg((255, 0, 0))
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.status, self.headers.get("If-None-Match")))
+        if self.status == 200 and self.headers.get("If-None-Match") == '"cover"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = self.body if self.status == 200 else b"<html>not found</html>"
+        self.send_response(self.status)
+        self.send_header("ETag", '"cover"' if self.status == 200 else '"error"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cover():
+    CoverHandler.status = 200
+    CoverHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CoverHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/cover.jpg"
+    server.shutdown()
+    server.server_close()
+
+
+def test_cover_is_revalidated(cover, tmp_path):
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip, image_cache=HTTPCache(str(tmp_path)), skip_unchanged=False)
+        pixoo.url = fake.url
+        pixoo.send_url_image(cover)
+        pixoo.send_url_image(cover)
+        pixoo.close()
+    assert CoverHandler.requests == [(200, None), (200, '"cover"')]
+    assert fake.commands["Draw/SendHttpGif"] == 2
+
+
+def test_error_pages_are_not_cached(cover, tmp_path):
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip, image_cache=HTTPCache(str(tmp_path)))
+        pixoo.url = fake.url
+        CoverHandler.status = 404
+        with pytest.raises(requests.HTTPError):
+            pixoo.send_url_image(cover)
+
+        CoverHandler.status = 200
+        pixoo.send_url_image(cover)
+        pixoo.close()
+    # the error page's validator wasn't kept, so it wasn't sent back
+    assert CoverHandler.requests == [(404, None), (200, None)]
+    assert fake.commands["Draw/SendHttpGif"] == 1
@@ -0,0 +1,29 @@
+from cache import RemoteCache
+from fakepixoo import FakeDivoomCloud, FakePixoo64
+from metrics import Metrics
+from pixoo import Pixoo64
+
+
+def test_remote_posts_count_the_form_body():
+    metrics = Metrics()
+    with FakeDivoomCloud() as cloud:
+        pixoo = Pixoo64("127.0.0.1", metrics=metrics, remote_cache=RemoteCache(ttls={}))
+        pixoo.remote = cloud.url
+        pixoo.dial_list("Social", page=2)
+    assert metrics.bytes_sent["Channel/GetDialList"] == len("DialType=Social&Page=2")
+    assert ("network", "Channel/GetDialList") in metrics.latency
+    # the transport encodes the form, there is no serialize stage to time
+    assert ("serialize", "Channel/GetDialList") not in metrics.latency
+
+
+def test_local_posts_time_every_stage():
+    metrics = Metrics()
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip, metrics=metrics)
+        pixoo.url = fake.url
+        pixoo.set_brightness(50)
+    assert metrics.requests["Channel/SetBrightness"] == 1
+    assert metrics.bytes_sent["Channel/SetBrightness"] == len(
+        '{"Command": "Channel/SetBrightness", "Brightness": 50}')
+    assert {stage for stage, command in metrics.latency
+            if command == "Channel/SetBrightness"} == {"serialize", "network"}
@@ -0,0 +1,74 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from asyncpixoo import AsyncPixoo64
+from canvas import Canvas
+from fakepixoo import FakePixoo64
+from metrics import Metrics
+from pixoo import Pixoo64
+
+
+class RecordingPixoo64(FakePixoo64):
+    def __init__(self, **kwargs):
+        self.pic_ids = []
+        super().__init__(**kwargs)
+
+    def _send_http_gif(self, data):
+        self.pic_ids.append(data["PicID"])
+        return super()._send_http_gif(data)
+
+    _handlers = {**FakePixoo64._handlers, "Draw/SendHttpGif": _send_http_gif}
+
+
+def send_from_threads(pixoo, threads=8, sends=10):
+    def send(thread):
+        for i in range(sends):
+            canvas = Canvas()
+            canvas.fill((thread * 30, i * 20, 0))
+            pixoo.send_canvas(canvas)
+
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(send, range(threads)))
+
+
+@pytest.mark.parametrize("refresh", [False, True])
+def test_threads_sharing_a_device(refresh):
+    metrics = Metrics()
+    with RecordingPixoo64(latency=0.002, lockup=refresh) as fake:
+        pixoo = Pixoo64(fake.ip, refresh=refresh, metrics=metrics)
+        pixoo.url = fake.url
+        send_from_threads(pixoo)
+        pixoo.close()
+
+    assert fake.commands["Draw/SendHttpGif"] == 80
+    assert fake.commands["Draw/GetHttpGifId"] == 1
+    assert not metrics.retries
+    if refresh:
+        # PicIDs 1 to 31, reset before every 32nd
+        assert fake.commands["Draw/ResetHttpGifId"] == 2
+        assert fake.pic_ids == [index % 31 + 1 for index in range(80)]
+        assert not fake.locked
+    else:
+        assert fake.pic_ids == list(range(1, 81))
+
+
+def test_tasks_sharing_an_async_device():
+    async def main(fake):
+        async with AsyncPixoo64(fake.ip, concurrency=4) as pixoo:
+            pixoo.url = fake.url
+
+            async def send(task):
+                for i in range(10):
+                    canvas = Canvas()
+                    canvas.fill((task * 30, i * 20, 0))
+                    await pixoo.send_canvas(canvas)
+
+            await asyncio.gather(*(send(task) for task in range(8)))
+
+    with RecordingPixoo64(latency=0.002, lockup=True) as fake:
+        asyncio.run(main(fake))
+    assert fake.commands["Draw/GetHttpGifId"] == 1
+    assert fake.commands["Draw/ResetHttpGifId"] == 2
+    assert fake.pic_ids == [index % 31 + 1 for index in range(80)]
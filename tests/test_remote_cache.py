@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from cache import RemoteCache
+from fakepixoo import FakeDivoomCloud, FakePixoo64
+from pixoo import Pixoo64
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cloud():
+    with FakeDivoomCloud() as cloud:
+        yield cloud
+
+
+def device(cloud, remote_cache, fake=None):
+    pixoo = Pixoo64(fake.ip if fake else "127.0.0.1", remote_cache=remote_cache)
+    pixoo.remote = cloud.url
+    if fake is not None:
+        pixoo.url = fake.url
+    return pixoo
+
+
+def test_fresh_answers_are_hits(cloud):
+    pixoo = device(cloud, RemoteCache())
+    first = pixoo.dial_type()
+    second = pixoo.dial_type()
+    assert first == second
+    assert "Social" in second.dial_type_list
+    assert cloud.requests["Channel/GetDialType"] == 1
+
+
+def test_uncached_endpoints_always_ask(cloud):
+    pixoo = device(cloud, RemoteCache(ttls={}))
+    pixoo.dial_type()
+    pixoo.dial_type()
+    assert cloud.requests["Channel/GetDialType"] == 2
+
+
+def test_requests_are_cached_apart(cloud):
+    pixoo = device(cloud, RemoteCache())
+    pixoo.dial_list("Social", page=1)
+    pixoo.dial_list("Social", page=2)
+    pixoo.dial_list("Social", page=1)
+    assert cloud.requests["Channel/GetDialList"] == 2
+
+
+def test_expired_answers_are_misses(cloud):
+    cache = RemoteCache(ttls={"Channel/GetDialType": 0.05})
+    pixoo = device(cloud, cache)
+    pixoo.dial_type()
+    time.sleep(0.1)
+    # stale, it's returned while the answer is fetched again
+    assert pixoo.dial_type().dial_type_list
+    wait_for(lambda: cloud.requests["Channel/GetDialType"] == 2)
+
+
+def test_stale_answers_while_offline(cloud):
+    cloud.answers["Channel/GetDialType"] = {"DialTypeList": ["old"]}
+    cache = RemoteCache(ttls={"Channel/GetDialType": 0.05})
+    pixoo = device(cloud, cache)
+    pixoo.dial_type()
+
+    cloud.offline = True
+    time.sleep(0.1)
+    start = time.perf_counter()
+    assert pixoo.dial_type().dial_type_list == ["old"]
+    assert time.perf_counter() - start < 0.5
+    # the refresh failed, the stale answer is kept and tried again next time
+    wait_for(lambda: not cache._refreshing)
+    assert pixoo.dial_type().dial_type_list == ["old"]
+
+    cloud.offline = False
+    cloud.answers["Channel/GetDialType"] = {"DialTypeList": ["new"]}
+    wait_for(lambda: cache.lookup("Channel/GetDialType")[1])
+    assert pixoo.dial_type().dial_type_list == ["new"]
+
+
+def test_answers_survive_a_restart(cloud, tmp_path):
+    path = str(tmp_path / "remote.json")
+    device(cloud, RemoteCache(path=path)).get_font_list()
+    assert cloud.requests["Device/GetTimeDialFontList"] == 1
+
+    cache = RemoteCache(path=path)
+    assert len(cache) == 1
+    assert len(device(cloud, cache).get_font_list().font_list) == 8
+    assert cloud.requests["Device/GetTimeDialFontList"] == 1
+
+
+def test_errors_are_not_cached(cloud):
+    pixoo = device(cloud, RemoteCache())
+    cloud.answers["Channel/GetDialType"] = {"ReturnCode": 1, "ReturnMessage": "busy"}
+    pixoo.dial_type()
+    pixoo.dial_type()
+    assert cloud.requests["Channel/GetDialType"] == 2
+
+
+def test_send_text_does_not_wait_for_the_font_list(cloud):
+    cloud.latency = 1.0
+    with FakePixoo64() as fake:
+        cache = RemoteCache()
+        pixoo = device(cloud, cache, fake)
+        start = time.perf_counter()
+        pixoo.send_text(1, 0, 0, 0, 2, 64, "hi", 10, "#FFFFFF", 1)
+        assert time.perf_counter() - start < 0.5
+        assert fake.commands["Draw/SendHttpText"] == 1
+        # the font list is fetched in the background for the next text
+        wait_for(lambda: cache.lookup("Device/GetTimeDialFontList")[1])
@@ -0,0 +1,112 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from sampler import MAX_FRAMES, frame_durations, merge_duplicates, sample_durations, sample_gif
+
+
+def make_gif(durations, frames=None):
+    '''
+    :param durations: the delay of every frame in ms, multiples of 10
+    :param frames: the images, default is a different color per frame, so
+        Pillow doesn't merge them on save
+    '''
+    if frames is None:
+        frames = [Image.new("RGB", (16, 16), (index % 256, index // 256 * 40, 0))
+                  for index in range(len(durations))]
+    gif = BytesIO()
+    frames[0].save(gif, "GIF", save_all=True, append_images=frames[1:],
+                   duration=list(durations), loop=0)
+    gif.seek(0)
+    return Image.open(gif)
+
+
+def halves(left, right, dot=None):
+    '''
+    :return: a frame with a left and a right half, and one pixel changed at dot
+    '''
+    frame = Image.new("L", (16, 16), left)
+    frame.paste(right, (8, 0, 16, 16))
+    if dot is not None:
+        frame.putpixel(dot, 128)
+    return frame.convert("RGB")
+
+
+def played(sample):
+    return len(sample.indices) * sample.pic_speed
+
+
+def test_uniform_delays():
+    with make_gif([80] * 10) as gif:
+        sample = sample_gif(gif)
+    assert sample.indices == list(range(10))
+    assert sample.pic_speed == 80
+    assert played(sample) == 800
+
+
+def test_variable_delays_repeat_long_frames():
+    with make_gif([100, 300, 100]) as gif:
+        assert frame_durations(gif) == [100, 300, 100]
+        sample = sample_gif(gif)
+    assert sample.indices == [0, 1, 1, 1, 2]
+    assert sample.pic_speed == 100
+    assert played(sample) == 500
+
+
+def test_short_delays_play_like_browsers():
+    with make_gif([10, 200]) as gif:
+        assert frame_durations(gif) == [100, 200]
+
+
+def test_single_frame():
+    with make_gif([500]) as gif:
+        sample = sample_gif(gif)
+    assert sample.indices == [0]
+    assert sample.pic_speed == 500
+
+
+def test_frames_are_capped():
+    with make_gif([50] * 120) as gif:
+        sample = sample_gif(gif)
+    assert len(sample.indices) == MAX_FRAMES
+    assert sample.indices == sorted(sample.indices)
+    # every step of the time grid is sampled in its middle, across the whole gif
+    assert len(set(sample.indices)) == MAX_FRAMES
+    assert sample.indices[0] <= 1 and sample.indices[-1] >= 118
+    assert sample.pic_speed == round(6000 / MAX_FRAMES)
+    # rounding the speed to whole ms is the only error
+    assert abs(played(sample) - 6000) <= MAX_FRAMES / 2
+
+
+def test_dedupe_merges_near_duplicates():
+    frames = [halves(0, 255), halves(0, 255, (1, 1)), halves(0, 255, (2, 2)),
+              halves(255, 0), halves(0, 0)]
+    with make_gif([100] * 5, frames) as gif:
+        durations = frame_durations(gif)
+        assert merge_duplicates(gif, durations) == [(0, 300), (3, 100), (4, 100)]
+        sample = sample_gif(gif, dedupe=True)
+        assert sample_gif(gif).indices == [0, 1, 2, 3, 4]
+    assert sample.indices == [0, 0, 0, 3, 4]
+    assert sample.pic_speed == 100
+    assert played(sample) == 500
+
+
+def test_dedupe_drops_duplicates_before_unique_frames():
+    frames = [halves(0, 255, (x, 0)) for x in range(4)] + [halves(255, 0), halves(0, 0)]
+    with make_gif([100] * 6, frames) as gif:
+        sample = sample_gif(gif, max_frames=3, dedupe=True)
+    assert set(sample.indices) <= {0, 4, 5}
+    assert abs(played(sample) - 600) <= 3 / 2
+
+
+@pytest.mark.parametrize("segments, indices, speed", [
+    ([(0, 100)], [0], 100),
+    ([(0, 40), (1, 40), (2, 80)], [0, 1, 2, 2], 40),
+    ([(0, 100), (5, 100)], [0, 5], 100),
+])
+def test_sample_durations(segments, indices, speed):
+    sample = sample_durations(segments)
+    assert sample.indices == indices
+    assert sample.pic_speed == speed
+    assert played(sample) == sum(duration for _, duration in segments)
@@ -0,0 +1,112 @@
+import functools
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from benchmark import QuietFileHandler, noise_gif
+from fakepixoo import FakePixoo64
+from pixoo import Pixoo64
+from transport import HTTPTransport, read_body
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    '''
+    Description: streams chunks of zeros without a Content-Length.
+    '''
+    protocol_version = "HTTP/1.1"
+    chunks = 64
+    chunk = b"\0" * 64 * 1024
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for _ in range(self.chunks):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(self.chunk), self.chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture(scope="module")
+def large_gif(tmp_path_factory):
+    '''
+    :return: the url and size of a multi megabyte gif, served locally
+    '''
+    directory = tmp_path_factory.mktemp("gifs")
+    size = noise_gif(str(directory / "noise.gif"))
+    assert size > 3 * 1024 * 1024
+
+    server = serve(functools.partial(QuietFileHandler, directory=str(directory)))
+    yield f"http://127.0.0.1:{server.server_port}/noise.gif", size
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport():
+    with HTTPTransport() as transport:
+        yield transport
+
+
+def test_content_length_over_the_limit(large_gif, transport):
+    url, size = large_gif
+    response = transport.get(url, stream=True)
+    with pytest.raises(ValueError, match="the limit is"):
+        read_body(response, max_bytes=size - 1)
+
+
+def test_limit_without_content_length(transport):
+    server = serve(ChunkedHandler)
+    try:
+        response = transport.get(f"http://127.0.0.1:{server.server_port}/", stream=True)
+        assert "Content-Length" not in response.headers
+        with pytest.raises(ValueError, match="over the limit"):
+            read_body(response, max_bytes=1024 * 1024)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_device_refuses_big_gifs(large_gif):
+    url, size = large_gif
+    with FakePixoo64() as fake:
+        pixoo = Pixoo64(fake.ip, max_download_size=size // 2)
+        pixoo.url = fake.url
+        with pytest.raises(ValueError):
+            pixoo.send_url_gif(url)
+        assert fake.commands["Draw/SendHttpGif"] == 0
+        pixoo.close()
+
+
+def test_streamed_gif_memory_is_bounded(large_gif, transport):
+    url, size = large_gif
+    pixoo = Pixoo64("127.0.0.1")
+
+    tracemalloc.start()
+    try:
+        body = read_body(transport.get(url, stream=True))
+        with body, Image.open(body) as gif:
+            # spilled to disk instead of held in memory
+            assert body._rolled
+            frames = list(pixoo._gif_frames(gif))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pixoo.close()
+
+    assert len(frames) == 59
+    assert peak < size / 2